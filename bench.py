@@ -0,0 +1,315 @@
+"""Offline load test for the bot handlers.
+
+Replays synthetic updates through the real handlers with a fake Telegram API,
+so no token or network is needed:
+
+    python bench.py --sights 10000 --requests 2000 --concurrency 8
+    python bench.py --sights 10000 --save      # store as the new baseline
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_PHOTO = os.path.join(REPO_DIR, 'images', 'yagra_island.jpg')
+BOT_ID = 999
+SYLLABLES = ['ar', 'kha', 'ngel', 'sk', 'so', 'lov', 'ki', 'pi', 'ne', 'ga', 'ka', 'rel', 'ya', 'gra', 'mo', 'ro']
+REGRESSION = 1.25  # p95 allowed to grow by this factor before we fail
+
+
+def synthetic_name(rng):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(3)).capitalize() for _ in range(2))
+
+
+def write_catalog(path, count, rng):
+    sights = []
+    for sight_id in range(1, count + 1):
+        name = synthetic_name(rng)
+        sights.append({
+            'name': {'en': name, 'ru': f"{name} (ru)"},
+            'description': {'en': f"A place near {synthetic_name(rng)}", 'ru': "Описание"},
+            'fun_fact': {'en': "Polar bears were seen here!", 'ru': "Тут видели белых медведей!"},
+            'photo': 'bench.jpg',
+            'location': f"https://yandex.ru/maps/?ll={30 + rng.random() * 20:.6f}%2C{60 + rng.random() * 10:.6f}&z=16",
+            'id': sight_id
+        })
+    with open(path, 'w') as f:
+        json.dump({'sights': sights}, f)
+
+
+class IOCounter:
+    # File opens seen by the audit hook plus the kernel's read/write byte counters
+    def __init__(self):
+        self.opens = 0
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if event in ('open', 'sqlite3.connect'):
+            self.opens += 1
+
+    @staticmethod
+    def proc_io():
+        try:
+            with open('/proc/self/io') as f:
+                fields = dict(line.split(': ') for line in f.read().splitlines())
+            return int(fields['rchar']), int(fields['wchar'])
+        except (OSError, KeyError):
+            return 0, 0
+
+    def snapshot(self):
+        opens = self.opens
+        read, written = self.proc_io()
+        return opens, read, written
+
+
+class ApiStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1000)
+        self.downloads = itertools.count()
+        self.calls = 0
+        self.uploaded = 0
+
+
+def make_fake_api(sample, stats):
+    from telegram.utils.request import Request
+
+    # PTB objects have __slots__, so the counters live in stats rather than on the request
+    class FakeRequest(Request):
+        # Answers Bot API calls locally with just enough data for PTB to parse
+        def __init__(self):
+            super().__init__(con_pool_size=1)
+
+        @staticmethod
+        def _message(data):
+            return {
+                'message_id': next(stats.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'},
+                'text': data.get('text') or '',
+                'photo': [{'file_id': 'cached-photo', 'file_unique_id': 'u', 'width': 1280, 'height': 960}],
+            }
+
+        def post(self, url, data, timeout=None):
+            endpoint = url.rsplit('/', 1)[-1]
+            with stats.lock:
+                stats.calls += 1
+                photo = data.get('photo')
+                if hasattr(photo, 'input_file_content'):
+                    stats.uploaded += len(photo.input_file_content)
+            if endpoint == 'getFile':
+                return {'file_id': data['file_id'], 'file_unique_id': 'u', 'file_path': 'photos/upload.jpg'}
+            if endpoint in ('sendMessage', 'sendPhoto', 'editMessageText', 'editMessageMedia'):
+                return self._message(data)
+            return True
+
+        def retrieve(self, url, timeout=None):
+            # Trailing bytes make every upload unique without breaking the JPEG
+            return sample + str(next(stats.downloads)).encode()
+
+    return FakeRequest()
+
+
+class Bench:
+    def __init__(self, bot_module, request, api_stats, rng):
+        from queue import Queue
+        from telegram import Bot, User
+        from telegram.ext import Dispatcher
+
+        self.bot_module = bot_module
+        self.api_stats = api_stats
+        self.rng = rng
+        self.bot = Bot('123456:bench', request=request)
+        self.bot._bot = User(BOT_ID, 'Bench', True, username='bench_bot')
+        self.dispatcher = Dispatcher(self.bot, Queue())
+        bot_module.register_handlers(self.dispatcher)
+        self.update_ids = itertools.count(1)
+        self.users = itertools.count(100)
+
+    def _send(self, user_id, text=None, photo=False, data=None):
+        from telegram import Update
+
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+        chat = {'id': user_id, 'type': 'private'}
+        message = {'message_id': next(self.update_ids), 'date': int(time.time()), 'chat': chat, 'from': user}
+        if data is not None:
+            bot_message = dict(message, **{'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench'}})
+            payload = {'callback_query': {'id': str(next(self.update_ids)), 'from': user, 'chat_instance': 'c',
+                                          'message': bot_message, 'data': data}}
+        elif photo:
+            payload = {'message': dict(message, photo=[
+                {'file_id': f"upload-{message['message_id']}", 'file_unique_id': 'u', 'width': 1280,
+                 'height': 960, 'file_size': 200000}
+            ])}
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            payload = {'message': message}
+        self.dispatcher.process_update(Update.de_json(dict(payload, update_id=next(self.update_ids)), self.bot))
+
+    def _timed(self, steps):
+        start = time.perf_counter()
+        steps()
+        return time.perf_counter() - start
+
+    # Scenarios: each returns the latency of the measured part
+    def rand(self):
+        return self._timed(lambda: self._send(next(self.users), '/rand'))
+
+    def list(self):
+        return self._timed(lambda: self._send(next(self.users), '/list'))
+
+    def page(self):
+        pages = max(1, len(self.bot_module.CATALOG.get()) // self.bot_module.ITEMS_PER_PAGE)
+        return self._timed(lambda: self._send(next(self.users), data=f"page_{self.rng.randrange(pages)}"))
+
+    def details(self):
+        sight = self.rng.choice(self.bot_module.CATALOG.get().sights)
+        return self._timed(lambda: self._send(next(self.users), data=f"details_{sight['id']}"))
+
+    def del_name(self):
+        user = next(self.users)
+        self.bot_module.WHITELIST.append(user)
+        self._send(user, '/del')
+        query = self.rng.choice(self.bot_module.CATALOG.get().sights)['name']['en'].split()[0]
+        latency = self._timed(lambda: self._send(user, query))
+        self._send(user, '/cancel')
+        return latency
+
+    def add(self):
+        user = next(self.users)
+        self.bot_module.WHITELIST.append(user)
+
+        def wizard():
+            self._send(user, '/add')
+            self._send(user, synthetic_name(self.rng))
+            self._send(user, "A brand new place")
+            self._send(user, "Nobody has been here yet")
+            self._send(user, photo=True)
+            self._send(user, f"https://yandex.ru/maps/?ll={self.rng.random() * 50:.6f}%2C64.5&z=16")
+        return self._timed(wizard)
+
+
+SCENARIOS = ['rand', 'list', 'page', 'details', 'del_name', 'add']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_scenario(bench, io, name, requests, concurrency):
+    scenario = getattr(bench, name)
+    opens, read, written = io.snapshot()
+    uploaded = bench.api_stats.uploaded
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(lambda _: scenario(), range(requests)))
+    elapsed = time.perf_counter() - start
+    end_opens, end_read, end_written = io.snapshot()
+    return {
+        'requests': requests,
+        'throughput': requests / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'opens_per_req': (end_opens - opens) / requests,
+        'read_bytes_per_req': (end_read - read) / requests,
+        'written_bytes_per_req': (end_written - written) / requests,
+        'uploaded_bytes_per_req': (bench.api_stats.uploaded - uploaded) / requests,
+    }
+
+
+def print_report(results, baseline):
+    header = f"{'scenario':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" \
+             f"{'opens':>8}{'read B':>12}{'write B':>12}{'upload B':>12}"
+    print(header)
+    print('-' * len(header))
+    regressions = []
+    for name, r in results.items():
+        line = f"{name:<10}{r['throughput']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}" \
+               f"{r['opens_per_req']:>8.1f}{r['read_bytes_per_req']:>12.0f}{r['written_bytes_per_req']:>12.0f}" \
+               f"{r['uploaded_bytes_per_req']:>12.0f}"
+        old = baseline.get(name)
+        if old:
+            change = r['p95_ms'] / old['p95_ms'] if old['p95_ms'] else 1.0
+            line += f"  p95 x{change:.2f} vs baseline"
+            if change > REGRESSION:
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sights', type=int, default=1000, help="catalog size (10 to 100000)")
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=os.path.join(REPO_DIR, 'bench_baseline.json'))
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='arctic-bench-')
+    try:
+        # bot.py works relative to the current directory and reads its config at import
+        os.makedirs(os.path.join(workdir, 'images'))
+        shutil.copy(SAMPLE_PHOTO, os.path.join(workdir, 'images', 'bench.jpg'))
+        write_catalog(os.path.join(workdir, 'sights.json'), args.sights, rng)
+        os.chdir(workdir)
+        os.environ['TRANSLATOR_BACKEND'] = 'stub'
+        sys.path.insert(0, REPO_DIR)
+        import bot
+        from outbound import Outbox
+
+        # Measure the handlers, not Telegram's flood limits
+        bot.OUTBOX = Outbox(global_rate=1e9, chat_rate=1e9)
+        bot.logger.setLevel('WARNING')
+
+        api_stats = ApiStats()
+        with open(SAMPLE_PHOTO, 'rb') as f:
+            request = make_fake_api(f.read(), api_stats)
+        bench = Bench(bot, request, api_stats, rng)
+        io = IOCounter()
+
+        key = f"{args.sights}x{args.concurrency}"
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baselines = json.load(f)
+
+        results = {}
+        for name in args.scenarios.split(','):
+            results[name] = run_scenario(bench, io, name, args.requests, args.concurrency)
+
+        print(f"{args.sights} sights, {args.requests} requests per scenario, concurrency {args.concurrency}")
+        regressions = print_report(results, baselines.get(key, {}))
+
+        if args.save:
+            baselines[key] = results
+            with open(args.baseline, 'w') as f:
+                json.dump(baselines, f, indent=2)
+            print(f"Baseline saved to {args.baseline}")
+        elif regressions:
+            print(f"p95 regressed by more than {REGRESSION - 1:.0%} in: {', '.join(regressions)}")
+            return 1
+        return 0
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
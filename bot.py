@@ -1,23 +1,102 @@
-import os
+import argparse
+import datetime
+import hashlib
 import json
+import os
 import logging
-import random
-import re
-from deep_translator import GoogleTranslator
-from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
+import threading
+import time
+from queue import Queue
+from telegram import (
+    Bot, Update, InputFile, InputMediaPhoto, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InputTextMessageContent
+)
 from telegram.error import BadRequest
 from telegram.ext import (
     Updater, CommandHandler, CallbackContext,
     MessageHandler, Filters, ConversationHandler,
-    CallbackQueryHandler
+    CallbackQueryHandler, InlineQueryHandler, JobQueue
 )
-from telegram.utils.helpers import escape_markdown
+from telegram.utils.request import Request
+from broadcast import Broadcaster, Subscribers
+from bulk import BulkImporter, read_records, write_records
+from catalog import Catalog
+from concurrency import ChatOrderedDispatcher, LatestOnly, RecentKeys
+from geo import backfill_coords, parse_coords
+from webhook import run_webhook
+from images import ingest_photo, MAX_PHOTO_BYTES
+from janitor import Janitor
+import metrics
+from outbound import Outbox
+from persistence import UserStatePersistence
+from photo_cache import PhotoCache
+from render import RenderCache
+from shuffle import ShuffleBags
+from storage import open_storage
+from translator import open_translator, TranslationPipeline
 
 # Configuration
+TOKEN = os.environ.get('BOT_TOKEN', 'YOUR_BOT_TOKEN')  # Replace with your actual bot token
 WHITELIST = []  # Replace with admin user IDs
-SIGHTS_FILE = 'sights.json'
+SIGHTS_FILE = 'sights.json'  # Seed for the database and import/export format
+SNAPSHOT_FILE = 'sights.snapshot'  # Prebuilt catalog, indexes and renders for fast restarts
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')  # 'sqlite', 'records' or 'json'
+DATABASE_FILE = 'sights.db'
+RECORDS_FILE = 'sights.ndjson'  # Append-only record file of the 'records' backend
+CATALOG_POLL_SECONDS = float(os.environ.get('CATALOG_POLL_SECONDS', 1))  # Delay before other processes' writes show
 IMAGES_DIR = 'images'
+PHOTO_IDS_FILE = 'photo_ids.json'
+TRANSLATOR_BACKEND = os.environ.get('TRANSLATOR_BACKEND', 'google')  # 'google' or 'stub' (offline, for tests)
+TRANSLATIONS_DB = 'translations.db'
+TRANSLATION_CACHE_SIZE = 10000
+TRANSLATION_WORKERS = 2
+TRANSLATION_TIMEOUT = 10  # Seconds /add waits for translations before saving
+BULK_BATCH_SIZE = 500  # Sights per transaction for `python bot.py import`
+BULK_WORKERS = 8  # Parallel translations and photo conversions during an import
 ITEMS_PER_PAGE = 5
+SEARCH_LIMIT = 10
+NEARBY_LIMIT = 5  # Sights listed for a shared location
+INLINE_PAGE_SIZE = 20  # Results per inline answer, Telegram allows up to 50
+INLINE_CACHE_TIME = 300  # Seconds Telegram may reuse an inline answer for the same query
+CAROUSEL_WORKERS = 4  # Threads editing details messages for the prev/next buttons
+FEATURED_WEIGHT = 3  # Sights marked "featured" come up this many times per round of /rand
+RANDOM_BAGS_SIZE = 200000  # Users whose /rand order is remembered
+CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', 8))  # Chats handled in parallel
+PENDING_UPDATES_LIMIT = 1000  # Queued updates before further navigation taps are only answered
+CALLBACK_MAX_AGE = 10  # Seconds a navigation tap may wait, while the bot is busy, before it is only answered
+CALLBACK_PRESSURE = 100  # Queued updates from which CALLBACK_MAX_AGE applies
+DETAILS_WINDOW = 3  # Seconds in which repeated taps on the same Details button open it once
+CLEANUP_INTERVAL = 600  # Seconds between background sweeps for deleted sights and unused images
+CLEANUP_BATCH_SIZE = 100  # Sights purged or files checked before the sweep pauses
+IMAGE_GRACE_SECONDS = 24 * 3600  # Unused images younger than this may belong to an /add in progress
+USER_STATE_DB = 'users.db'  # Language and list page of every user, kept across restarts
+USER_STATE_FLUSH_SECONDS = 5  # Changed users are written at most this often
+USER_STATE_CACHE_SIZE = 100000  # Users kept in memory, the rest are read back when they return
+
+# Daily "sight of the day" broadcast to /subscribe'd chats
+SUBSCRIBERS_DB = 'subscribers.db'
+BROADCAST_TIME = datetime.time.fromisoformat(os.environ.get('BROADCAST_TIME', '09:00'))  # UTC
+BROADCAST_RATE = 20  # Messages per second, the rest of GLOBAL_SEND_RATE is left for replies
+BROADCAST_WORKERS = 8
+BROADCAST_PAGE_SIZE = 500  # Subscribers read and checkpointed at a time
+CONNECTION_POOL_SIZE = int(os.environ.get('CONNECTION_POOL_SIZE', CHAT_WORKERS + BROADCAST_WORKERS + 4))
+
+# Webhook mode; polling is used unless BOT_MODE=webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '127.0.0.1')  # Behind a reverse proxy
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8080))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')  # Public https URL the proxy forwards to us
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+
+# Telegram flood limits for outgoing messages
+GLOBAL_SEND_RATE = 30  # Messages per second for the whole bot
+CHAT_SEND_RATE = 1  # Messages per second in one chat, after a short burst
+CHAT_SEND_BURST = 3
+
+# Prometheus metrics, only reachable from this host by default; 0 turns the endpoint off
+METRICS_LISTEN = os.environ.get('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +104,7 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+logging.getLogger().addHandler(metrics.ErrorLogCounter())
 
 # Translations with kid-friendly content
 TRANSLATIONS = {
@@ -48,6 +128,10 @@ TRANSLATIONS = {
             "/dev - About this bot 🤖\n"
             "/rand - Random magical place 🎲\n"
             "/list - List all magical places 📜\n"  # New line
+            "/search - Find a magical place by name 🔎\n"
+            "📍 Share your location to find places nearby\n"
+            "/subscribe - Get a magical place every day 🌅\n"
+            "/unsubscribe - Stop the daily magical place 🌙\n"
             "/add - Add new magic places (Wizards only) ✨\n"
             "/del - Remove magic places (Wizards only) 🧹\n\n"
             "Let's explore the Arctic wonders together! ❄️"
@@ -75,7 +159,6 @@ TRANSLATIONS = {
         'add_funfact': "🎩 Share a cool fact that kids will love:",
         'add_photo': "📸 Send a photo of this place now!",
         'add_location': "🗺️ Share a Yandex Maps link to this place:",
-        'translation_error': "🔍 Oops! Translation magic failed. Try again later!",
         'invalid_link': "⚠️ That doesn't look like a valid link. Please send a proper Yandex Maps URL:",
         'photo_error': "📷 Oh no! Couldn't save the photo. Try again!",
         'add_success': "🌟 New magical place added! Now everyone can find it!",
@@ -88,7 +171,16 @@ TRANSLATIONS = {
         'details_button': "🔍 Details",
         'prev_button': "⬅️ Previous",
         'next_button': "➡️ Next",
-        'back_list': "📜 Back to List"
+        'back_list': "📜 Back to List",
+        'search_usage': "🔎 Tell me what to look for, e.g. /search museum",
+        'search_results': "🔎 Found these magical places:",
+        'search_empty': "🔍 No magical places match \"{query}\"",
+        'nearby_title': "📍 Magical places closest to you:",
+        'nearby_item': "{name} ({distance} km)",
+        'subscribed': "🌅 Hooray! A magical place will come to you every day!",
+        'already_subscribed': "🌅 You're already getting a magical place every day!",
+        'unsubscribed': "🌙 Okay, no more daily magical places. Come back with /subscribe!",
+        'not_subscribed': "🌙 You aren't getting daily magical places. Try /subscribe!"
     },
     'ru': {
         'welcome': "🌍 Выберите язык / Choose your language:",
@@ -110,6 +202,10 @@ TRANSLATIONS = {
             "/dev - О боте 🤖\n"
             "/rand - Случайное волшебное место 🎲\n"
             "/list - Список всех мест 📜\n"  # New line
+            "/search - Найти волшебное место по названию 🔎\n"
+            "📍 Отправь геопозицию, чтобы найти места рядом\n"
+            "/subscribe - Волшебное место каждый день 🌅\n"
+            "/unsubscribe - Больше не присылать место дня 🌙\n"
             "/add - Добавить волшебные места (Только для волшебников) ✨\n"
             "/del - Удалить волшебные места (Только для волшебников) 🧹\n\n"
             "Давайте исследовать северные чудеса вместе! ❄️"
@@ -137,7 +233,6 @@ TRANSLATIONS = {
         'add_funfact': "🎩 Поделись интересным фактом, который понравится детям:",
         'add_photo': "📸 Отправь фотографию этого места!",
         'add_location': "🗺️ Отправь ссылку на Yandex Maps:",
-        'translation_error': "🔍 Ой! Перевод не удался. Попробуйте позже!",
         'invalid_link': "⚠️ Это не похоже на правильную ссылку. Отправь корректную ссылку Yandex Maps:",
         'photo_error': "📷 Ой! Не удалось сохранить фото. Попробуй еще раз!",
         'add_success': "🌟 Новое волшебное место добавлено! Теперь все могут его найти!",
@@ -150,13 +245,74 @@ TRANSLATIONS = {
         'details_button': "🔍 Подробнее",
         'prev_button': "⬅️ Назад",
         'next_button': "➡️ Вперед",
-        'back_list': "📜 Назад к списку"
+        'back_list': "📜 Назад к списку",
+        'search_usage': "🔎 Напиши, что искать, например /search музей",
+        'search_results': "🔎 Нашлись такие волшебные места:",
+        'search_empty': "🔍 Нет волшебных мест по запросу \"{query}\"",
+        'nearby_title': "📍 Ближайшие к тебе волшебные места:",
+        'nearby_item': "{name} ({distance} км)",
+        'subscribed': "🌅 Ура! Каждый день я буду присылать тебе волшебное место!",
+        'already_subscribed': "🌅 Ты уже получаешь волшебное место каждый день!",
+        'unsubscribed': "🌙 Хорошо, больше не буду присылать место дня. Возвращайся через /subscribe!",
+        'not_subscribed': "🌙 Ты не получаешь место дня. Попробуй /subscribe!"
     }
 }
 
 # Create images directory if not exists
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
+# Sight storage and the shared in-memory catalog on top of it
+STORAGE = open_storage(STORAGE_BACKEND, SIGHTS_FILE, DATABASE_FILE, RECORDS_FILE)
+CATALOG = Catalog(
+    STORAGE,
+    render=lambda sights, **delta: RenderCache(sights, TRANSLATIONS, ITEMS_PER_PAGE, **delta),
+    snapshot_file=SNAPSHOT_FILE,
+    poll_interval=CATALOG_POLL_SECONDS,
+    # Snapshots rendered with other texts or page sizes are rebuilt
+    snapshot_key=hashlib.sha256(json.dumps([TRANSLATIONS, ITEMS_PER_PAGE], sort_keys=True).encode()).hexdigest()
+)
+
+# Per-user /rand order, so nobody sees a sight twice before seeing the rest
+RANDOM_BAGS = ShuffleBags(
+    weight=lambda sight: FEATURED_WEIGHT if sight.get('featured') else 1,
+    capacity=RANDOM_BAGS_SIZE
+)
+
+# Every outgoing message is paced through here
+OUTBOX = Outbox(GLOBAL_SEND_RATE, CHAT_SEND_RATE, CHAT_SEND_BURST)
+metrics.OUTBOX_WAITING.read = lambda: OUTBOX.waiting
+
+# Repeated taps on the same Details button within DETAILS_WINDOW
+DETAILS_TAPS = RecentKeys(DETAILS_WINDOW)
+
+# Per-user settings, loaded when a user first shows up after a start
+PERSISTENCE = UserStatePersistence(USER_STATE_DB, USER_STATE_CACHE_SIZE)
+
+# Chats getting the sight of the day and the progress of each day's broadcast
+SUBSCRIBERS = Subscribers(SUBSCRIBERS_DB)
+
+# Carousel taps on one message are collapsed so only the newest target is shown
+CAROUSEL = LatestOnly(workers=CAROUSEL_WORKERS)
+
+# Telegram file_ids of already uploaded sight photos
+PHOTO_CACHE = PhotoCache(PHOTO_IDS_FILE, IMAGES_DIR)
+
+# Purges deleted sights and unused images in the background
+JANITOR = Janitor(
+    STORAGE, IMAGES_DIR,
+    interval=CLEANUP_INTERVAL,
+    batch_size=CLEANUP_BATCH_SIZE,
+    grace=IMAGE_GRACE_SECONDS,
+    on_removed=PHOTO_CACHE.invalidate
+)
+
+# Translator with a persistent translation memory in front of it
+TRANSLATOR = open_translator(TRANSLATOR_BACKEND, TRANSLATIONS_DB, TRANSLATION_CACHE_SIZE)
+
+# Background translation for the /add wizard
+TRANSLATION_PIPELINE = TranslationPipeline(TRANSLATOR, workers=TRANSLATION_WORKERS)
+TRANSLATION_FILL_LOCK = threading.Lock()
+
 # Conversation states
 NAME, DESCRIPTION, FUN_FACT, PHOTO, LOCATION = range(5)
 
@@ -171,7 +327,8 @@ def start(update: Update, context: CallbackContext) -> None:
             InlineKeyboardButton("Русский 🇷🇺", callback_data='ru')
         ]
     ]
-    update.message.reply_text(
+    OUTBOX.send(
+        update.message.reply_text,
         text=TRANSLATIONS['en']['welcome'],
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
@@ -186,7 +343,7 @@ def help_command(update: Update, context: CallbackContext) -> None:
         help_text = help_text.replace("/add - Add new magic places (Wizards only) ✨\n", "")
         help_text = help_text.replace("/add - Добавить волшебные места (Только для волшебников) ✨\n", "")
 
-    update.message.reply_text(help_text)
+    OUTBOX.send(update.message.reply_text, help_text)
 
 
 def lang_command(update: Update, context: CallbackContext) -> None:
@@ -197,7 +354,8 @@ def lang_command(update: Update, context: CallbackContext) -> None:
             InlineKeyboardButton("Русский 🇷🇺", callback_data='ru')
         ]
     ]
-    update.message.reply_text(
+    OUTBOX.send(
+        update.message.reply_text,
         text=TRANSLATIONS[lang]['lang_change'],
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
@@ -205,68 +363,152 @@ def lang_command(update: Update, context: CallbackContext) -> None:
 
 def dev_command(update: Update, context: CallbackContext) -> None:
     lang = context.user_data.get('lang', 'en')
-    update.message.reply_text(TRANSLATIONS[lang]['dev_info'])
+    text = TRANSLATIONS[lang]['dev_info']
+
+    # Admins also get a look at how the bot is doing
+    if update.effective_user.id in WHITELIST:
+        text += "\n\n📊 Metrics:\n" + metrics.summary()
+        last = SUBSCRIBERS.broadcast()
+        text += f"\n📬 Subscribers: {SUBSCRIBERS.count()}"
+        if last:
+            status = "done" if last['finished'] else "running"
+            text += (f", last broadcast {last['day']} ({status}): "
+                     f"{last['sent']} sent, {last['failed']} failed of {last['total']}")
+
+    OUTBOX.send(update.message.reply_text, text)
 
 
 def random_sight(update: Update, context: CallbackContext) -> None:
     lang = context.user_data.get('lang', 'en')
 
     try:
-        with open(SIGHTS_FILE, 'r') as f:
-            sights = json.load(f)['sights']
+        catalog = CATALOG.get()
 
-        if not sights:
-            update.message.reply_text(TRANSLATIONS[lang]['no_sights'])
+        if not catalog.sights:
+            OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['no_sights'])
             return
 
-        sight = random.choice(sights)
-
-        # Prepare message
-        caption = (
-            f"✨ *{escape_markdown(sight['name'][lang], version=2)}*\n\n"
-            f"📖 {escape_markdown(sight['description'][lang], version=2)}\n\n"
-            f"🎩 {escape_markdown(sight['fun_fact'][lang], version=2)}"
-        )
-
-        # Create location button
-        keyboard = [[InlineKeyboardButton(
-            TRANSLATIONS[lang]['show_location'],
-            url=sight['location']
-        )]]
+        sight = RANDOM_BAGS.draw(update.effective_user.id, catalog)
+        card = catalog.renders.card(sight['id'], lang)
 
         # Send photo with caption
         try:
-            photo_path = os.path.join(IMAGES_DIR, sight['photo'])
-            with open(photo_path, 'rb') as photo_file:
-                update.message.reply_photo(
-                    photo=InputFile(photo_file),
-                    caption=caption,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='MarkdownV2'
-                )
+            send_sight_photo(
+                update.message.reply_photo,
+                sight,
+                caption=card.caption,
+                reply_markup=card.keyboard,
+                parse_mode='MarkdownV2'
+            )
         except Exception as e:
             logger.error(f"Photo error: {str(e)}")
-            update.message.reply_text(
-                caption,
-                reply_markup=InlineKeyboardMarkup(keyboard),
+            OUTBOX.send(
+                update.message.reply_text,
+                card.caption,
+                reply_markup=card.keyboard,
                 parse_mode='MarkdownV2'
             )
 
     except Exception as e:
         logger.error(f"Random sight error: {str(e)}")
-        update.message.reply_text(TRANSLATIONS[lang]['error'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['error'])
+
+
+def send_sight_photo(send, sight, edit=False, **kwargs):
+    # Reuse the file_id Telegram gave us last time, upload the file only once.
+    # With edit=True, send is an edit_message_media method and the photo replaces the old one
+    def call(photo):
+        if edit:
+            media = InputMediaPhoto(photo, caption=kwargs.get('caption'), parse_mode=kwargs.get('parse_mode'))
+            return OUTBOX.send(send, media=media, reply_markup=kwargs.get('reply_markup'))
+        return OUTBOX.send(send, photo=photo, **kwargs)
+
+    filename = sight['photo']
+    file_id = PHOTO_CACHE.get(filename)
+    if file_id:
+        try:
+            message = call(file_id)
+            metrics.PHOTO_SENDS.inc('cached')
+            return message
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return None
+            logger.warning(f"Cached photo rejected, re-uploading: {str(e)}")
+            PHOTO_CACHE.invalidate(filename)
+
+    with open(os.path.join(IMAGES_DIR, filename), 'rb') as photo_file:
+        message = call(InputFile(photo_file) if not edit else photo_file)
+    if message is not None:  # None when a newer edit of the same message replaced this one
+        metrics.PHOTO_SENDS.inc('upload')
+        try:
+            PHOTO_CACHE.put(filename, message.photo[-1].file_id)
+        except Exception as e:
+            # The photo is out already; callers must not fall back to sending it again as text
+            logger.error(f"Could not cache file_id of {filename}: {str(e)}")
+    return message
+
+
+def subscribe_command(update: Update, context: CallbackContext) -> None:
+    lang = context.user_data.get('lang', 'en')
+    new = SUBSCRIBERS.subscribe(update.effective_chat.id, lang)
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['subscribed' if new else 'already_subscribed'])
+
+
+def unsubscribe_command(update: Update, context: CallbackContext) -> None:
+    lang = context.user_data.get('lang', 'en')
+    removed = SUBSCRIBERS.unsubscribe(update.effective_chat.id)
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['unsubscribed' if removed else 'not_subscribed'])
+
+
+def send_daily_sight(bot, chat_id, lang, sight_id):
+    # Raises when the message did not go out, the broadcast counts it as failed
+    catalog = CATALOG.get()
+    card = catalog.renders.card(sight_id, lang)
+    send_sight_photo(
+        bot.send_photo,
+        catalog.by_id[sight_id],
+        chat_id=chat_id,
+        caption=card.caption,
+        reply_markup=card.keyboard,
+        parse_mode='MarkdownV2'
+    )
+
+
+def flush_user_state(context: CallbackContext) -> None:
+    try:
+        PERSISTENCE.flush()
+    except Exception as e:
+        logger.error(f"User state flush error: {str(e)}")
+
+
+def daily_broadcast(context: CallbackContext) -> None:
+    # Scheduled once a day; the startup run only finishes a broadcast a crash interrupted
+    resume_only = context.job.context == 'resume'
+    broadcaster = Broadcaster(
+        SUBSCRIBERS,
+        lambda chat_id, lang, sight_id: send_daily_sight(context.bot, chat_id, lang, sight_id),
+        rate=BROADCAST_RATE,
+        workers=BROADCAST_WORKERS,
+        page_size=BROADCAST_PAGE_SIZE
+    )
+    try:
+        broadcaster.run(CATALOG.get(), datetime.datetime.utcnow().date().isoformat(), resume_only=resume_only)
+    except Exception as e:
+        logger.error(f"Broadcast error: {str(e)}")
 
 
 def button_click(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     lang = query.data
     context.user_data['lang'] = lang
+    SUBSCRIBERS.set_lang(query.message.chat_id, lang)
 
     # Edit original message to remove language buttons
-    query.edit_message_text(text=f"🌐 Language set to {lang.upper()}!")
+    OUTBOX.send(query.edit_message_text, text=f"🌐 Language set to {lang.upper()}!")
 
     # Send main welcome message
-    query.message.reply_text(
+    OUTBOX.send(
+        query.message.reply_text,
         text=TRANSLATIONS[lang]['start_message'],
         parse_mode='Markdown'
     )
@@ -278,9 +520,10 @@ def error_handler(update: Update, context: CallbackContext) -> None:
 
     try:
         if update.message:
-            update.message.reply_text(TRANSLATIONS[lang]['error'])
+            OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['error'])
         else:
-            context.bot.send_message(
+            OUTBOX.send(
+                context.bot.send_message,
                 chat_id=update.callback_query.message.chat_id,
                 text=TRANSLATIONS[lang]['error']
             )
@@ -288,91 +531,107 @@ def error_handler(update: Update, context: CallbackContext) -> None:
         logger.error(f"Error in error handler: {str(e)}")
 
 
-def sanitize_filename(name):
-    # Remove special characters and format for filename
-    name = re.sub(r'[^\w\s-]', '', name).strip().lower()
-    return re.sub(r'[-\s]+', '_', name)
+def start_translation(context, field, text):
+    user_lang = context.user_data.get('lang', 'en')
+    other_lang = 'ru' if user_lang == 'en' else 'en'
+    context.user_data['pending_translations'][field] = TRANSLATION_PIPELINE.submit(
+        [text], user_lang, other_lang
+    )
 
 
-def translate_text(text, source_lang, target_lang):
-    try:
-        return GoogleTranslator(source=source_lang, target=target_lang).translate(text)
-    except Exception as e:
-        logging.error(f"Translation error: {str(e)}")
-        return None
+def collect_translations(sight, pending, user_lang):
+    # Wait for the background translations, return the fields that did not make it
+    other_lang = 'ru' if user_lang == 'en' else 'en'
+    deadline = time.monotonic() + TRANSLATION_TIMEOUT
+    missing = {}
+    for field, future in pending.items():
+        translations = TRANSLATION_PIPELINE.wait(future, deadline - time.monotonic())
+        if translations:
+            sight[field][other_lang] = translations[0]
+        else:
+            # Show the original text until the translation arrives
+            sight[field][other_lang] = sight[field][user_lang]
+            missing[field] = future
+    return missing
+
+
+def fill_missing_translations(sight, missing, user_lang):
+    other_lang = 'ru' if user_lang == 'en' else 'en'
+
+    def store(fields):
+        def callback(translations):
+            with TRANSLATION_FILL_LOCK:
+                stored = STORAGE.get(sight['id'])
+                if stored is None:  # Deleted in the meantime
+                    return
+                for field, translation in zip(fields, translations):
+                    stored[field][other_lang] = translation
+                STORAGE.update(stored)
+            logger.info(f"Filled in late translations {fields} for sight {sight['id']}")
+        return callback
+
+    # Still running translations get to finish, failed ones are retried in one batch
+    failed = []
+    for field, future in missing.items():
+        if future.done():
+            failed.append(field)
+        else:
+            TRANSLATION_PIPELINE.fill_later(
+                [sight[field][user_lang]], user_lang, other_lang, store([field]), future
+            )
+    if failed:
+        TRANSLATION_PIPELINE.fill_later(
+            [sight[field][user_lang] for field in failed], user_lang, other_lang, store(failed)
+        )
 
 
 def add_start(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
     if user_id not in WHITELIST:
         lang = context.user_data.get('lang', 'en')
-        update.message.reply_text(TRANSLATIONS[lang]['permission_denied'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['permission_denied'])
         return ConversationHandler.END
 
     context.user_data['new_sight'] = {}
+    context.user_data['pending_translations'] = {}
     lang = context.user_data.get('lang', 'en')
-    update.message.reply_text(TRANSLATIONS[lang]['add_name'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['add_name'])
     return NAME
 
 
 def handle_name(update: Update, context: CallbackContext) -> int:
     user_lang = context.user_data.get('lang', 'en')
-    other_lang = 'ru' if user_lang == 'en' else 'en'
     name = update.message.text
 
-    # Translate name
-    translated_name = translate_text(name, user_lang, other_lang)
-    if not translated_name:
-        update.message.reply_text(TRANSLATIONS[user_lang]['translation_error'])
-        return ConversationHandler.END
-
-    # Store names
-    context.user_data['new_sight']['name'] = {
-        user_lang: name,
-        other_lang: translated_name
-    }
+    # Keep the original now, the translation runs in the background
+    context.user_data['new_sight']['name'] = {user_lang: name}
+    start_translation(context, 'name', name)
 
-    update.message.reply_text(TRANSLATIONS[user_lang]['add_description'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['add_description'])
     return DESCRIPTION
 
 
 def handle_description(update: Update, context: CallbackContext) -> int:
     user_lang = context.user_data.get('lang', 'en')
-    other_lang = 'ru' if user_lang == 'en' else 'en'
     description = update.message.text
 
-    # Translate description
-    translated_desc = translate_text(description, user_lang, other_lang)
-    if not translated_desc:
-        update.message.reply_text(TRANSLATIONS[user_lang]['translation_error'])
-        return ConversationHandler.END
-
-    context.user_data['new_sight']['description'] = {
-        user_lang: description,
-        other_lang: translated_desc
-    }
+    # Keep the original now, the translation runs in the background
+    context.user_data['new_sight']['description'] = {user_lang: description}
+    start_translation(context, 'description', description)
 
-    update.message.reply_text(TRANSLATIONS[user_lang]['add_funfact'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['add_funfact'])
     return FUN_FACT
 
 
 def handle_funfact(update: Update, context: CallbackContext) -> int:
     user_lang = context.user_data.get('lang', 'en')
-    other_lang = 'ru' if user_lang == 'en' else 'en'
     funfact = update.message.text
 
-    # Translate fun fact
-    translated_funfact = translate_text(funfact, user_lang, other_lang)
-    if not translated_funfact:
-        update.message.reply_text(TRANSLATIONS[user_lang]['translation_error'])
-        return ConversationHandler.END
+    # Keep the original now, the translation runs in the background
+    context.user_data['new_sight']['fun_fact'] = {user_lang: funfact}
+    start_translation(context, 'fun_fact', funfact)
 
-    context.user_data['new_sight']['fun_fact'] = {
-        user_lang: funfact,
-        other_lang: translated_funfact
-    }
-
-    update.message.reply_text(TRANSLATIONS[user_lang]['add_photo'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['add_photo'])
     return PHOTO
 
 
@@ -380,27 +639,21 @@ def handle_photo(update: Update, context: CallbackContext) -> int:
     user_lang = context.user_data.get('lang', 'en')
     try:
         # Get the highest resolution photo
-        photo_file = update.message.photo[-1].get_file()
-
-        # Get English name for filename
-        en_name = context.user_data['new_sight']['name'].get('en')
-        if not en_name:  # If user was using Russian
-            en_name = context.user_data['new_sight']['name']['ru']
+        photo = update.message.photo[-1]
+        if photo.file_size and photo.file_size > MAX_PHOTO_BYTES:
+            raise ValueError(f"Photo too large: {photo.file_size} bytes")
+        photo_file = photo.get_file()
 
-        # Generate filename
-        filename = f"{sanitize_filename(en_name)}.jpg"
-        file_path = os.path.join(IMAGES_DIR, filename)
-
-        # Download and save photo
-        photo_file.download(file_path)
+        # Resized copy, named by content hash
+        filename = ingest_photo(lambda path: photo_file.download(custom_path=path), IMAGES_DIR)
         context.user_data['new_sight']['photo'] = filename
 
-        update.message.reply_text(TRANSLATIONS[user_lang]['add_location'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['add_location'])
         return LOCATION
 
     except Exception as e:
         logging.error(f"Photo error: {str(e)}")
-        update.message.reply_text(TRANSLATIONS[user_lang]['photo_error'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['photo_error'])
         return ConversationHandler.END
 
 
@@ -410,31 +663,34 @@ def handle_location(update: Update, context: CallbackContext) -> int:
 
     # Basic URL validation
     if not location.startswith(('http://', 'https://')):
-        update.message.reply_text(TRANSLATIONS[user_lang]['invalid_link'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['invalid_link'])
         return LOCATION
 
     context.user_data['new_sight']['location'] = location
+    coords = parse_coords(location)
+    if coords:
+        context.user_data['new_sight']['coords'] = coords
+    missing = collect_translations(
+        context.user_data['new_sight'], context.user_data.pop('pending_translations', {}), user_lang
+    )
 
-    # Save to JSON
+    # Save to storage, the id comes from the storage sequence
     try:
-        with open(SIGHTS_FILE, 'r+') as f:
-            data = json.load(f)
-            context.user_data['new_sight']['id'] = len(data['sights']) + 1
-            data['sights'].append(context.user_data['new_sight'])
-            f.seek(0)
-            json.dump(data, f, indent=2)
-            f.truncate()
+        sight = STORAGE.insert(context.user_data['new_sight'])
     except Exception as e:
         logging.error(f"Save error: {str(e)}")
         return ConversationHandler.END
 
-    update.message.reply_text(TRANSLATIONS[user_lang]['add_success'])
+    if missing:
+        fill_missing_translations(sight, missing, user_lang)
+
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[user_lang]['add_success'])
     return ConversationHandler.END
 
 
 def cancel(update: Update, context: CallbackContext) -> int:
     lang = context.user_data.get('lang', 'en')
-    update.message.reply_text(TRANSLATIONS[lang]['cancel'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['cancel'])
     return ConversationHandler.END
 
 
@@ -442,30 +698,23 @@ def del_start(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
     if user_id not in WHITELIST:
         lang = context.user_data.get('lang', 'en')
-        update.message.reply_text(TRANSLATIONS[lang]['permission_denied'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['permission_denied'])
         return ConversationHandler.END
 
     lang = context.user_data.get('lang', 'en')
-    update.message.reply_text(TRANSLATIONS[lang]['del_start'])
+    OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['del_start'])
     return DEL_NAME
 
 
 def handle_del_name(update: Update, context: CallbackContext) -> int:
     lang = context.user_data.get('lang', 'en')
-    search_name = update.message.text.strip().lower()
-
-    with open(SIGHTS_FILE, 'r') as f:
-        sights = json.load(f)['sights']
+    search_name = update.message.text.strip()
 
     # Find matches in both languages
-    matches = []
-    for sight in sights:
-        if (search_name in sight['name']['en'].lower() or
-                search_name in sight['name']['ru'].lower()):
-            matches.append(sight)
+    matches = CATALOG.get().search_index().search(search_name, limit=SEARCH_LIMIT, names_only=True)
 
     if not matches:
-        update.message.reply_text(TRANSLATIONS[lang]['del_fail'].format(name=search_name))
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['del_fail'].format(name=search_name))
         return ConversationHandler.END
 
     context.user_data['del_candidates'] = matches
@@ -476,7 +725,8 @@ def handle_del_name(update: Update, context: CallbackContext) -> int:
             [InlineKeyboardButton("✅ Yes", callback_data='del_confirm'),
              InlineKeyboardButton("❌ No", callback_data='del_cancel')]
         ]
-        update.message.reply_text(
+        OUTBOX.send(
+            update.message.reply_text,
             TRANSLATIONS[lang]['del_confirm'].format(name=sight['name'][lang]),
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -485,8 +735,8 @@ def handle_del_name(update: Update, context: CallbackContext) -> int:
         text = [TRANSLATIONS[lang]['del_list']]
         for idx, sight in enumerate(matches, 1):
             text.append(f"{idx}. {sight['name'][lang]}")
-        update.message.reply_text("\n".join(text))
-        update.message.reply_text(TRANSLATIONS[lang]['del_start'])
+        OUTBOX.send(update.message.reply_text, "\n".join(text))
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['del_start'])
         return DEL_NAME
 
 
@@ -496,28 +746,16 @@ def handle_del_confirm(update: Update, context: CallbackContext) -> int:
     lang = context.user_data.get('lang', 'en')
 
     if query.data == 'del_cancel':
-        query.edit_message_text(TRANSLATIONS[lang]['del_cancel'])
+        OUTBOX.send(query.edit_message_text, TRANSLATIONS[lang]['del_cancel'])
         return ConversationHandler.END
 
     # Get first match (for simplicity, could implement selection)
     sight = context.user_data['del_candidates'][0]
 
-    # Remove from JSON
-    with open(SIGHTS_FILE, 'r+') as f:
-        data = json.load(f)
-        data['sights'] = [s for s in data['sights'] if s['id'] != sight['id']]
-        f.seek(0)
-        json.dump(data, f, indent=2)
-        f.truncate()
+    # Hidden from everyone at once; the row and its images are cleaned up in the background
+    STORAGE.delete(sight['id'])
 
-    # Remove associated image
-    try:
-        if 'photo' in sight:
-            os.remove(os.path.join(IMAGES_DIR, sight['photo']))
-    except Exception as e:
-        logging.error(f"Error deleting image: {str(e)}")
-
-    query.edit_message_text(TRANSLATIONS[lang]['del_success'].format(name=sight['name'][lang]))
+    OUTBOX.send(query.edit_message_text, TRANSLATIONS[lang]['del_success'].format(name=sight['name'][lang]))
     return ConversationHandler.END
 
 
@@ -525,72 +763,45 @@ def list_sights(update: Update, context: CallbackContext) -> None:
     lang = context.user_data.get('lang', 'en')
 
     try:
-        with open(SIGHTS_FILE, 'r') as f:
-            sights = json.load(f)['sights']
+        catalog = CATALOG.get()
 
-        if not sights:
-            update.message.reply_text(TRANSLATIONS[lang]['no_sights'])
+        if not catalog.sights:
+            OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['no_sights'])
             return
 
         context.user_data['current_page'] = 0
-        show_sight_list(update, context, sights, 0, lang)
+        show_sight_list(update, context, catalog, 0, lang)
 
     except Exception as e:
         logger.error(f"List error: {str(e)}")
-        update.message.reply_text(TRANSLATIONS[lang]['error'])
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['error'])
 
 
-def show_sight_list(update, context, sights, page, lang):
-    start = page * ITEMS_PER_PAGE
-    end = start + ITEMS_PER_PAGE
-    page_sights = sights[start:end]
-
-    keyboard = []
-    for idx, sight in enumerate(page_sights, start + 1):
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{idx}. {sight['name'][lang]}",
-                callback_data=f"details_{sight['id']}"
-            )
-        ])
-
-    # Add navigation buttons
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(
-            TRANSLATIONS[lang]['prev_button'],
-            callback_data=f"page_{page - 1}"
-        ))
-    if end < len(sights):
-        nav_buttons.append(InlineKeyboardButton(
-            TRANSLATIONS[lang]['next_button'],
-            callback_data=f"page_{page + 1}"
-        ))
-
-    if nav_buttons:
-        keyboard.append(nav_buttons)
-
-    text = TRANSLATIONS[lang]['list_title'].format(page=page + 1)
+def show_sight_list(update, context, catalog, page, lang):
+    text, reply_markup = catalog.renders.page(page, lang)
 
     try:
         if update.callback_query:
             # Edit existing message if possible
-            update.callback_query.edit_message_text(
+            OUTBOX.send(
+                update.callback_query.edit_message_text,
                 text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
         else:
-            update.message.reply_text(
+            OUTBOX.send(
+                update.message.reply_text,
                 text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
     except BadRequest as e:
         if "Message is not modified" not in str(e):
             # Send new message if editing failed
-            context.bot.send_message(
+            OUTBOX.send(
+                context.bot.send_message,
                 chat_id=update.effective_chat.id,
                 text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
 
 
@@ -601,27 +812,30 @@ def handle_list_callback(update: Update, context: CallbackContext):
     data = query.data
 
     try:
-        with open(SIGHTS_FILE, 'r') as f:
-            sights = json.load(f)['sights']
+        catalog = CATALOG.get()
 
         if data.startswith('page_'):
             page = int(data.split('_')[1])
-            show_sight_list(update, context, sights, page, lang)
+            context.user_data['current_page'] = page
+            show_sight_list(update, context, catalog, page, lang)
 
         elif data.startswith('details_'):
             sight_id = int(data.split('_')[1])
-            sight = next(s for s in sights if s['id'] == sight_id)
-            show_sight_details(update, context, sight, lang)
+            if DETAILS_TAPS.seen((query.message.chat_id, sight_id)):
+                return
+            sight = catalog.by_id[sight_id]
+            show_sight_details(update, context, catalog, sight, lang)
 
         elif data == 'back_to_list':
             page = context.user_data.get('current_page', 0)
-            show_sight_list(update, context, sights, page, lang)
+            show_sight_list(update, context, catalog, page, lang)
 
     except Exception as e:
         logger.error(f"List callback error: {str(e)}")
         try:
             # Send new message instead of editing
-            context.bot.send_message(
+            OUTBOX.send(
+                context.bot.send_message,
                 chat_id=query.message.chat_id,
                 text=TRANSLATIONS[lang]['error']
             )
@@ -629,61 +843,219 @@ def handle_list_callback(update: Update, context: CallbackContext):
             logger.error(f"Error sending error message: {str(send_error)}")
 
 
-def show_sight_details(update, context, sight, lang):
+def search_command(update: Update, context: CallbackContext) -> None:
+    lang = context.user_data.get('lang', 'en')
+    query = ' '.join(context.args)
+
+    if not query:
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['search_usage'])
+        return
+
     try:
-        caption = (
-            f"✨ *{escape_markdown(sight['name'][lang], version=2)}*\n\n"
-            f"📖 {escape_markdown(sight['description'][lang], version=2)}\n\n"
-            f"🎩 {escape_markdown(sight['fun_fact'][lang], version=2)}"
-        )
+        matches = CATALOG.get().search_index().search(query, limit=SEARCH_LIMIT)
+        if not matches:
+            OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['search_empty'].format(query=query))
+            return
 
+        # Same details buttons as /list, handled by handle_list_callback
         keyboard = [
-            [
-                InlineKeyboardButton(
-                    TRANSLATIONS[lang]['show_location'],
-                    url=sight['location']
-                ),
-                InlineKeyboardButton(
-                    TRANSLATIONS[lang]['back_list'],
-                    callback_data='back_to_list'
-                )
-            ]
+            [InlineKeyboardButton(f"{idx}. {sight['name'][lang]}", callback_data=f"details_{sight['id']}")]
+            for idx, sight in enumerate(matches, 1)
         ]
+        OUTBOX.send(
+            update.message.reply_text,
+            TRANSLATIONS[lang]['search_results'],
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['error'])
+
+
+def nearby_sights(update: Update, context: CallbackContext) -> None:
+    lang = context.user_data.get('lang', 'en')
+    location = update.message.location
+
+    try:
+        catalog = CATALOG.get()
+        nearest = catalog.geo_index().nearest(location.latitude, location.longitude, NEARBY_LIMIT)
+        if not nearest:
+            OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['no_sights'])
+            return
+
+        # Same details buttons as /list, handled by handle_list_callback
+        keyboard = []
+        for distance, sight_id in nearest:
+            label = TRANSLATIONS[lang]['nearby_item'].format(
+                name=catalog.by_id[sight_id]['name'][lang],
+                distance=f"{distance:.1f}" if distance < 10 else f"{distance:.0f}"
+            )
+            keyboard.append([InlineKeyboardButton(label, callback_data=f"details_{sight_id}")])
+        OUTBOX.send(
+            update.message.reply_text,
+            TRANSLATIONS[lang]['nearby_title'],
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    except Exception as e:
+        logger.error(f"Nearby error: {str(e)}")
+        OUTBOX.send(update.message.reply_text, TRANSLATIONS[lang]['error'])
+
+
+def inline_lang(text, context):
+    # Answers depend only on the query text, so Telegram can share them between users
+    if any('а' <= ch <= 'я' or ch == 'ё' for ch in text.casefold()):
+        return 'ru'
+    return 'en' if text else context.user_data.get('lang', 'en')
+
+
+def inline_result(catalog, sight, lang):
+    card = catalog.renders.card(sight['id'], lang)
+    file_id = PHOTO_CACHE.get(sight['photo'])
+    if file_id:
+        # Telegram already has the photo, nothing is uploaded
+        return InlineQueryResultCachedPhoto(
+            id=str(sight['id']),
+            photo_file_id=file_id,
+            title=sight['name'][lang],
+            caption=card.caption,
+            parse_mode='MarkdownV2',
+            reply_markup=card.keyboard
+        )
+    # Photo never sent yet, so there is no file_id to point to
+    return InlineQueryResultArticle(
+        id=str(sight['id']),
+        title=sight['name'][lang],
+        description=sight['description'][lang][:100],
+        input_message_content=InputTextMessageContent(card.caption, parse_mode='MarkdownV2'),
+        reply_markup=card.keyboard
+    )
+
+
+def inline_query(update: Update, context: CallbackContext) -> None:
+    query = update.inline_query
+    text = query.query.strip()
+    lang = inline_lang(text, context)
+    offset = int(query.offset) if query.offset.isdigit() else 0
+
+    try:
+        catalog = CATALOG.get()
+        end = offset + INLINE_PAGE_SIZE
+        if text:
+            # One extra match tells whether there is another page
+            sights = catalog.search_index().search(text, limit=end + 1, names_only=True)[offset:]
+        else:
+            sights = catalog.sights[offset:end + 1]
+
+        results = []
+        for sight in sights[:INLINE_PAGE_SIZE]:
+            try:
+                results.append(inline_result(catalog, sight, lang))
+            except (KeyError, OSError) as e:
+                logger.warning(f"Sight {sight['id']} left out of inline results: {str(e)}")
+
+        query.answer(
+            results,
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=not text,
+            next_offset=str(end) if len(sights) > INLINE_PAGE_SIZE else ''
+        )
+
+    except Exception as e:
+        logger.error(f"Inline query error: {str(e)}")
+
+
+def handle_carousel(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    query.answer()
+    lang = context.user_data.get('lang', 'en')
+    sight_id = int(query.data.split('_')[1])
+
+    # Returns at once; rapid taps on the same message only render the newest target
+    key = (query.message.chat_id, query.message.message_id)
+    CAROUSEL.submit(key, lambda: show_carousel_sight(query, sight_id, lang))
+
+
+def show_carousel_sight(query, sight_id, lang):
+    try:
+        catalog = CATALOG.get()
+        sight = catalog.by_id.get(sight_id)
+        if sight is None:  # Deleted since the buttons were made
+            return
+        card = catalog.renders.card(sight_id, lang)
+        send_sight_photo(
+            query.edit_message_media,
+            sight,
+            edit=True,
+            caption=card.caption,
+            reply_markup=card.details_keyboard,
+            parse_mode='MarkdownV2'
+        )
+    except Exception as e:
+        logger.error(f"Carousel error: {str(e)}")
+
+
+def show_sight_details(update, context, catalog, sight, lang):
+    try:
+        card = catalog.renders.card(sight['id'], lang)
 
         try:
-            photo_path = os.path.join(IMAGES_DIR, sight['photo'])
-            with open(photo_path, 'rb') as photo_file:
-                # Send as new message instead of editing
-                context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=InputFile(photo_file),
-                    caption=caption,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='MarkdownV2'
-                )
+            # Send as new message instead of editing
+            send_sight_photo(
+                context.bot.send_photo,
+                sight,
+                chat_id=update.effective_chat.id,
+                caption=card.caption,
+                reply_markup=card.details_keyboard,
+                parse_mode='MarkdownV2'
+            )
         except Exception as e:
             logger.error(f"Detail photo error: {str(e)}")
-            context.bot.send_message(
+            OUTBOX.send(
+                context.bot.send_message,
                 chat_id=update.effective_chat.id,
-                text=caption,
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                text=card.caption,
+                reply_markup=card.details_keyboard,
                 parse_mode='MarkdownV2'
             )
 
     except Exception as e:
         logger.error(f"Detail error: {str(e)}")
-        context.bot.send_message(
+        OUTBOX.send(
+            context.bot.send_message,
             chat_id=update.effective_chat.id,
             text=TRANSLATIONS[lang]['error']
         )
 
 
-def main() -> None:
-    # Replace 'YOUR_BOT_TOKEN' with your actual bot token
-    updater = Updater(token='YOUR_BOT_TOKEN')
+def coalesce_key(query):
+    # Taps that replace each other while they wait: every navigation of one message collapses
+    # into the newest, and identical Details taps into one. Only these taps may be skipped
+    data = query.data or ''
+    if query.message is None:
+        return None
+    if data.startswith(('page_', 'back_to_list', 'carousel_')):
+        return query.message.message_id, 'navigate'
+    if data.startswith('details_'):
+        return query.message.message_id, data
+    return None
+
+
+def create_updater(token):
+    # Every chat and broadcast worker may hold an HTTP connection, plus a few for polling and jobs
+    bot = Bot(token, request=Request(con_pool_size=CONNECTION_POOL_SIZE))
+    job_queue = JobQueue()
+    dispatcher = ChatOrderedDispatcher(
+        bot, Queue(), job_queue=job_queue, persistence=PERSISTENCE, chat_workers=CHAT_WORKERS,
+        coalesce=coalesce_key, max_pending=PENDING_UPDATES_LIMIT, max_age=CALLBACK_MAX_AGE,
+        pressure=CALLBACK_PRESSURE
+    )
+    job_queue.set_dispatcher(dispatcher)
+    return Updater(dispatcher=dispatcher)
 
-    dispatcher = updater.dispatcher
 
+def register_handlers(dispatcher) -> None:
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('add', add_start)],
         states={
@@ -716,16 +1088,110 @@ def main() -> None:
     dispatcher.add_handler(conv_handler)
     dispatcher.add_handler(del_conv_handler)
     dispatcher.add_handler(CommandHandler('list', list_sights))
+    dispatcher.add_handler(CommandHandler('search', search_command))
+    dispatcher.add_handler(CommandHandler('subscribe', subscribe_command))
+    dispatcher.add_handler(CommandHandler('unsubscribe', unsubscribe_command))
+    dispatcher.add_handler(MessageHandler(Filters.location, nearby_sights))
+    dispatcher.add_handler(InlineQueryHandler(inline_query))
     dispatcher.add_handler(CallbackQueryHandler(handle_list_callback, pattern='^(page_|details_|back_to_list)'))
+    dispatcher.add_handler(CallbackQueryHandler(handle_carousel, pattern='^carousel_'))
     dispatcher.add_handler(CallbackQueryHandler(button_click, pattern='^(en|ru)$'))
 
+    # Latency and error counts for every handler above
+    for handlers in dispatcher.handlers.values():
+        metrics.instrument_handlers(handlers)
+
     # Error handling
     dispatcher.add_error_handler(error_handler)
 
+
+def main() -> None:
+    # Load the catalog now rather than on the first user's request; if it had to be
+    # rebuilt, write a fresh snapshot for the next start in the background
+    CATALOG.get()
+    threading.Thread(target=CATALOG.save_snapshot, name='snapshot', daemon=True).start()
+
+    updater = create_updater(TOKEN)
+    register_handlers(updater.dispatcher)
+
+    # Sight of the day, and whatever part of today's broadcast a crash left unsent
+    updater.job_queue.run_daily(daily_broadcast, BROADCAST_TIME, name='daily-broadcast')
+    updater.job_queue.run_once(daily_broadcast, 10, context='resume', name='resume-broadcast')
+    updater.job_queue.run_repeating(flush_user_state, USER_STATE_FLUSH_SECONDS, name='flush-user-state')
+
+    # Cleanup only runs while no updates are waiting
+    dispatcher = updater.dispatcher
+    JANITOR.busy = lambda: dispatcher.update_queue.qsize() + dispatcher.chat_executor.queued() > 0
+    JANITOR.start()
+
+    if METRICS_PORT:
+        metrics.QUEUE_DEPTH.read = lambda: dispatcher.update_queue.qsize() + dispatcher.chat_executor.queued()
+        metrics.start_metrics_server(METRICS_PORT, METRICS_LISTEN)
+
     # Start the Bot
-    updater.start_polling()
-    updater.idle()
+    try:
+        if BOT_MODE == 'webhook':
+            metrics.mark_ready()
+            run_webhook(updater, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET)
+        else:
+            updater.start_polling()
+            metrics.mark_ready()
+            updater.idle()
+    finally:
+        # User settings first, they cannot be rebuilt; a failed snapshot only costs a slower start
+        try:
+            PERSISTENCE.flush()
+        finally:
+            JANITOR.stop()
+            # Sights added while running are in the next start's snapshot
+            CATALOG.save_snapshot()
+
+
+def import_sights(path, batch_size=BULK_BATCH_SIZE):
+    importer = BulkImporter(STORAGE, TRANSLATOR, IMAGES_DIR, batch_size=batch_size, workers=BULK_WORKERS)
+    stats = importer.run(read_records(path))
+    logger.info(
+        f"Import finished: {stats['imported']} added, {stats['skipped']} skipped, "
+        f"{stats['untranslated']} texts left untranslated"
+    )
+
+
+def export_sights(path):
+    if path.lower().endswith('.json'):
+        # Same format as sights.json, e.g. to seed a fresh database or go back to the json backend
+        count = STORAGE.export_json(path)
+    else:
+        count = write_records(STORAGE.iter_sights(), path, IMAGES_DIR)
+    logger.info(f"Exported {count} sights to {path}")
+
+
+def cli(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Arctic Adventures Bot")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('run', help="run the bot (default)")
+    import_parser = commands.add_parser('import', help="add sights from a .csv or .jsonl file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    export_parser = commands.add_parser('export', help="write all sights to a .csv, .jsonl or sights.json style .json file")
+    export_parser.add_argument('path')
+    commands.add_parser('snapshot', help="prebuild the catalog snapshot the bot starts from")
+    commands.add_parser('cleanup', help="purge deleted sights and remove unused images now")
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        import_sights(args.path, args.batch_size)
+    elif args.command == 'export':
+        export_sights(args.path)
+    elif args.command == 'snapshot':
+        # Sights saved before coordinates were parsed from their map links; the bot itself
+        # parses their links on the fly, so this only needs to run once
+        backfill_coords(STORAGE)
+        CATALOG.save_snapshot()
+    elif args.command == 'cleanup':
+        JANITOR.run_once()
+    else:
+        main()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
@@ -0,0 +1,243 @@
+import fcntl
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import BadRequest, Unauthorized
+
+from metrics import BROADCAST_SENDS
+from outbound import RateLimit
+
+logger = logging.getLogger(__name__)
+
+# Cursor of a broadcast nothing was sent for yet; group chats have negative ids
+NO_CHAT = -2 ** 63
+
+
+class Subscribers:
+    # Chats that get the daily sight, plus the progress of each day's broadcast
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS subscribers (
+            chat_id INTEGER PRIMARY KEY,
+            lang TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            day TEXT PRIMARY KEY,
+            sight_id INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            cursor INTEGER NOT NULL,  -- Every chat up to this id is done
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started REAL NOT NULL,
+            finished REAL
+        );
+        -- Chats past the cursor that were already handled, so a resumed broadcast skips them
+        CREATE TABLE IF NOT EXISTS deliveries (
+            chat_id INTEGER PRIMARY KEY
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def subscribe(self, chat_id, lang):
+        # Returns False if the chat was already subscribed (its language is updated anyway)
+        conn = self._conn()
+        new = conn.execute("INSERT OR IGNORE INTO subscribers (chat_id, lang) VALUES (?, ?)", (chat_id, lang)).rowcount
+        if not new:
+            conn.execute("UPDATE subscribers SET lang = ? WHERE chat_id = ?", (lang, chat_id))
+        return bool(new)
+
+    def unsubscribe(self, chat_id):
+        return self._conn().execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+    def set_lang(self, chat_id, lang):
+        self._conn().execute("UPDATE subscribers SET lang = ? WHERE chat_id = ?", (lang, chat_id))
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+    def page(self, after, limit):
+        # Keyset pagination, the full list is never held in memory
+        return self._conn().execute(
+            "SELECT chat_id, lang FROM subscribers WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (after, limit)
+        ).fetchall()
+
+    def broadcast(self, day=None):
+        # Progress of the given day's broadcast, or of the latest one
+        conn = self._conn()
+        conn.row_factory = sqlite3.Row
+        try:
+            if day is None:
+                row = conn.execute("SELECT * FROM broadcasts ORDER BY day DESC LIMIT 1").fetchone()
+            else:
+                row = conn.execute("SELECT * FROM broadcasts WHERE day = ?", (day,)).fetchone()
+        finally:
+            conn.row_factory = None
+        return dict(row) if row else None
+
+    def start_broadcast(self, day, sight_id):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM deliveries")
+            conn.execute(
+                "INSERT INTO broadcasts (day, sight_id, total, cursor, started) "
+                "VALUES (?, ?, (SELECT COUNT(*) FROM subscribers), ?, ?)", (day, sight_id, NO_CHAT, time.time())
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.broadcast(day)
+
+    def delivered(self, day, chat_id, ok):
+        # One transaction per message, so a crash never loses track of a sent one
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO deliveries (chat_id) VALUES (?)", (chat_id,))
+            column = 'sent' if ok else 'failed'
+            conn.execute(f"UPDATE broadcasts SET {column} = {column} + 1 WHERE day = ?", (day,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delivered_between(self, after, upto):
+        rows = self._conn().execute(
+            "SELECT chat_id FROM deliveries WHERE chat_id > ? AND chat_id <= ?", (after, upto)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def advance(self, day, cursor):
+        # Everything up to cursor is done; the per-chat marks below it are no longer needed
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE broadcasts SET cursor = ? WHERE day = ?", (cursor, day))
+            conn.execute("DELETE FROM deliveries WHERE chat_id <= ?", (cursor,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish(self, day):
+        self._conn().execute("UPDATE broadcasts SET finished = ? WHERE day = ?", (time.time(), day))
+
+
+def pick_daily(catalog, day):
+    # Same sight for everybody on a given day, also after a restart
+    digest = hashlib.sha256(day.encode()).digest()
+    return catalog.sights[int.from_bytes(digest[:8], 'big') % len(catalog.sights)]['id']
+
+
+class Broadcaster:
+    # Streams the subscribers page by page and sends them the day's sight on a few threads,
+    # paced below the global limit so interactive replies still get through
+    def __init__(self, subscribers, send, rate=20, workers=8, page_size=500):
+        self.subscribers = subscribers
+        self.send = send  # send(chat_id, lang, sight_id), raises when the message did not go out
+        self.workers = workers
+        self.page_size = page_size
+        self._limit = RateLimit(rate, 1)
+        self._limit_lock = threading.Lock()
+        self._warm = False
+
+    def run(self, catalog, day, resume_only=False):
+        # Returns the broadcast's progress row, or None if there was nothing to do. With several
+        # bot processes on the subscribers file, only one of them sends
+        with open(f"{self.subscribers.path}.lock", 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Broadcast {day} is being sent by another process")
+                return None
+            return self._run(catalog, day, resume_only)
+
+    def _run(self, catalog, day, resume_only):
+        state = self.subscribers.broadcast(day)
+        if state is None:
+            if resume_only or not catalog.sights:
+                return None
+            state = self.subscribers.start_broadcast(day, pick_daily(catalog, day))
+            logger.info(f"Broadcast {day}: sight {state['sight_id']} to {state['total']} subscribers")
+        elif state['finished']:
+            return state
+        else:
+            logger.info(f"Broadcast {day}: resuming after chat {state['cursor']}")
+
+        sight_id, cursor = state['sight_id'], state['cursor']
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='broadcast') as pool:
+            while True:
+                page = self.subscribers.page(cursor, self.page_size)
+                if not page:
+                    break
+                done = self.subscribers.delivered_between(cursor, page[-1][0])
+                pending = [(chat_id, lang) for chat_id, lang in page if chat_id not in done]
+                # Until one send went out the photo has no file_id yet; parallel sends would all upload it
+                while pending and not self._warm:
+                    self._warm = self._deliver(day, sight_id, *pending.pop(0))
+                futures = [pool.submit(self._deliver, day, sight_id, chat_id, lang) for chat_id, lang in pending]
+                for future in futures:
+                    future.result()
+                cursor = page[-1][0]
+                self.subscribers.advance(day, cursor)
+                self._report(self.subscribers.broadcast(day), "progress")
+
+        self.subscribers.finish(day)
+        state = self.subscribers.broadcast(day)
+        self._report(state, "finished")
+        return state
+
+    def _pace(self):
+        with self._limit_lock:
+            now = time.monotonic()
+            at = self._limit.earliest(now)
+            self._limit.take(at)
+        if at > now:
+            time.sleep(at - now)
+
+    def _deliver(self, day, sight_id, chat_id, lang):
+        self._pace()
+        ok = False
+        try:
+            self.send(chat_id, lang, sight_id)
+            ok = True
+        except Unauthorized:
+            # Blocked the bot or deleted the account
+            self.subscribers.unsubscribe(chat_id)
+        except BadRequest as e:
+            if 'chat not found' in str(e).lower():
+                self.subscribers.unsubscribe(chat_id)
+            else:
+                logger.warning(f"Broadcast to {chat_id} failed: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Broadcast to {chat_id} failed: {str(e)}")
+        BROADCAST_SENDS.inc('sent' if ok else 'failed')
+        self.subscribers.delivered(day, chat_id, ok)
+        return ok
+
+    @staticmethod
+    def _report(state, what):
+        handled = state['sent'] + state['failed']
+        elapsed = (state['finished'] or time.time()) - state['started']
+        logger.info(
+            f"Broadcast {state['day']} {what}: {handled}/{state['total']} handled, "
+            f"{state['sent']} sent ({100 * state['sent'] / max(handled, 1):.1f}%), "
+            f"{state['failed']} failed, {handled / max(elapsed, 1e-9):.1f} msg/s"
+        )
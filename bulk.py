@@ -0,0 +1,163 @@
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from geo import parse_coords
+from images import ingest_photo
+
+logger = logging.getLogger(__name__)
+
+LANGS = ('en', 'ru')
+TEXT_FIELDS = ('name', 'description', 'fun_fact')
+CSV_COLUMNS = [f"{field}_{lang}" for field in TEXT_FIELDS for lang in LANGS] + ['photo', 'location', 'featured']
+TRANSLATE_CHUNK = 20  # Texts per translator call, the Google backend sends them as one request
+
+
+def _is_csv(path):
+    return path.lower().endswith('.csv')
+
+
+def read_records(path):
+    # Streams sights from a CSV or JSONL file; photo paths are resolved relative to the file
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if _is_csv(path):
+            rows = (_from_csv_row(row) for row in csv.DictReader(f))
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for line_no, record in enumerate(rows, 1):
+            if record.get('photo'):
+                record['photo'] = os.path.join(base_dir, record['photo'])
+            yield line_no, record
+
+
+def _from_csv_row(row):
+    record = {field: {lang: row[f"{field}_{lang}"] for lang in LANGS if row.get(f"{field}_{lang}")}
+              for field in TEXT_FIELDS}
+    record['photo'] = row.get('photo')
+    record['location'] = row.get('location')
+    if (row.get('featured') or '').strip().lower() in ('1', 'true', 'yes'):
+        record['featured'] = True
+    return record
+
+
+def _has_text(record, field):
+    texts = record.get(field)
+    return isinstance(texts, dict) and any(texts.get(lang) for lang in LANGS)
+
+
+def write_records(sights, path, images_dir):
+    # Streams sights out in the format read_records takes back in; returns the count
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, CSV_COLUMNS) if _is_csv(path) else None
+        if writer:
+            writer.writeheader()
+        for sight in sights:
+            photo = os.path.abspath(os.path.join(images_dir, sight['photo'])) if sight.get('photo') else None
+            if writer:
+                row = {f"{field}_{lang}": sight.get(field, {}).get(lang, '') for field in TEXT_FIELDS for lang in LANGS}
+                row.update(photo=photo, location=sight.get('location'), featured=int(bool(sight.get('featured'))))
+                writer.writerow(row)
+            else:
+                record = {k: v for k, v in sight.items() if k != 'id'}
+                record['photo'] = photo
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+class BulkImporter:
+    # Adds sights in batches: translations and photos of a batch run in parallel, then one transaction
+    def __init__(self, storage, translator, images_dir, batch_size=500, workers=4):
+        self.storage = storage
+        self.translator = translator
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stats = {'imported': 0, 'skipped': 0, 'untranslated': 0}
+
+    def run(self, records):
+        start = time.monotonic()
+        records = iter(records)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                batch = list(itertools.islice(records, self.batch_size))
+                if not batch:
+                    break
+                sights = self._prepare(pool, batch)
+                if sights:
+                    self.storage.insert_many(sights)
+                self.stats['imported'] += len(sights)
+                elapsed = time.monotonic() - start
+                logger.info(f"Imported {self.stats['imported']} sights ({self.stats['imported'] / elapsed:.0f}/s)")
+        return self.stats
+
+    def _prepare(self, pool, batch):
+        valid = []
+        for line_no, record in batch:
+            if not all(_has_text(record, field) for field in TEXT_FIELDS) or not record.get('location'):
+                logger.warning(f"Record {line_no}: missing name, description, fun fact or location, skipped")
+                self.stats['skipped'] += 1
+            elif not record.get('photo') or not os.path.isfile(record['photo']):
+                logger.warning(f"Record {line_no}: photo {record.get('photo')} not found, skipped")
+                self.stats['skipped'] += 1
+            else:
+                valid.append((line_no, record))
+
+        photos = [pool.submit(self._ingest, record['photo']) for _, record in valid]
+        self._translate(pool, [record for _, record in valid])
+
+        sights = []
+        for (line_no, record), photo in zip(valid, photos):
+            try:
+                record['photo'] = photo.result()
+            except Exception as e:
+                logger.warning(f"Record {line_no}: photo could not be stored, skipped: {str(e)}")
+                self.stats['skipped'] += 1
+                continue
+            if 'coords' not in record:
+                coords = parse_coords(record['location'])
+                if coords:
+                    record['coords'] = coords
+            sights.append(record)
+        return sights
+
+    def _ingest(self, source):
+        return ingest_photo(lambda path: shutil.copyfile(source, path), self.images_dir)
+
+    def _translate(self, pool, records):
+        # Every text missing in one language, grouped by direction and sent in chunks
+        wanted = {}
+        for record in records:
+            for field in TEXT_FIELDS:
+                texts = record[field]
+                for target in LANGS:
+                    if not texts.get(target):
+                        source = next(lang for lang in LANGS if texts.get(lang))
+                        wanted.setdefault((source, target), []).append((texts, source))
+
+        jobs = []
+        for (source, target), items in wanted.items():
+            for idx in range(0, len(items), TRANSLATE_CHUNK):
+                chunk = items[idx:idx + TRANSLATE_CHUNK]
+                future = pool.submit(self.translator.translate_many, [t[s] for t, s in chunk], source, target)
+                jobs.append((future, chunk, target))
+
+        for future, chunk, target in jobs:
+            try:
+                translations = future.result()
+            except Exception as e:
+                logger.warning(f"Translation of {len(chunk)} texts failed, keeping the originals: {str(e)}")
+                translations = [None] * len(chunk)
+            for (texts, source), translation in zip(chunk, translations):
+                if not translation:
+                    self.stats['untranslated'] += 1
+                texts[target] = translation or texts[source]
@@ -0,0 +1,169 @@
+import logging
+import pickle
+import threading
+import time
+from operator import itemgetter
+from types import MappingProxyType
+
+from geo import GeoIndex
+from metrics import CATALOG_LOADS, CATALOG_UPDATES
+from search import SearchIndex
+from storage import replace_atomic
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pickled layout of snapshots, render caches or indexes changes
+SNAPSHOT_FORMAT = 3
+
+
+class CatalogSnapshot:
+    # Read-only view of the sights at one point in time; handlers must not mutate it
+    __slots__ = ('sights', 'by_id', 'version', 'renders', '_search_index', '_geo_index', '_index_lock')
+
+    def __init__(self, sights, version=None, render=None, previous=None, changed=()):
+        self.sights = tuple(sights)
+        self.by_id = MappingProxyType({sight['id']: sight for sight in self.sights})
+        self.version = version
+        # Pre-rendered messages, owned by the snapshot so they go stale together. Renders of
+        # the sights a delta did not touch are taken over from the previous snapshot
+        if render is None:
+            self.renders = None
+        elif previous is not None and previous.renders is not None:
+            self.renders = render(self.sights, previous=previous.renders, changed=changed)
+        else:
+            self.renders = render(self.sights)
+        self._search_index = None
+        self._geo_index = None
+        self._index_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sights)
+
+    def __getstate__(self):
+        # Indexes are built before pickling, so a restored snapshot has nothing left to build
+        return self.sights, self.version, self.renders, self.search_index(), self.geo_index()
+
+    def __setstate__(self, state):
+        self.sights, self.version, self.renders, self._search_index, self._geo_index = state
+        self.by_id = MappingProxyType({sight['id']: sight for sight in self.sights})
+        self._index_lock = threading.Lock()
+
+    def search_index(self):
+        # Built on first search; concurrent searches wait for that one build
+        if self._search_index is None:
+            with self._index_lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex(self.sights)
+        return self._search_index
+
+    def geo_index(self):
+        # Built on the first location query, like the search index
+        if self._geo_index is None:
+            with self._index_lock:
+                if self._geo_index is None:
+                    self._geo_index = GeoIndex(self.sights)
+        return self._geo_index
+
+
+class Catalog:
+    # Process-wide cache of the stored sights, reloaded only when the storage version changes.
+    # Writes of this process are seen at once; other processes sharing the storage are noticed
+    # by checking the version at most every poll_interval seconds, and then only the sights
+    # they changed are read again. With a snapshot file, a restart picks up the last built
+    # snapshot instead of rebuilding it; snapshot_key must change whenever the render settings do
+    def __init__(self, storage, render=None, snapshot_file=None, snapshot_key=None, poll_interval=0):
+        self.storage = storage
+        self.render = render
+        self.snapshot_file = snapshot_file
+        self.snapshot_key = snapshot_key
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._saved_version = None
+        self._checked = (0.0, None)  # (monotonic time, storage.writes) of the last version check
+
+    def get(self):
+        snapshot = self._snapshot
+        checked_at, writes = self._checked
+        if (snapshot is not None and writes == self.storage.writes
+                and time.monotonic() - checked_at < self.poll_interval):
+            return snapshot
+
+        writes = self.storage.writes
+        version = self.storage.version()
+        self._checked = (time.monotonic(), writes)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._snapshot is None and self.snapshot_file:
+                self._snapshot = self._restore(version)
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._reload(self._snapshot)
+            return self._snapshot
+
+    def _reload(self, old):
+        start = time.perf_counter()
+        delta = self.storage.changes(old.version) if old is not None else None
+        if delta is None:
+            version, sights = self.storage.load()
+            CATALOG_LOADS.inc()
+            snapshot = CatalogSnapshot(sights, version, self.render)
+            logger.info(f"Built catalog of {len(sights)} sights in {time.perf_counter() - start:.2f}s")
+            return snapshot
+
+        version, changed = delta
+        by_id = dict(old.by_id)
+        for sight_id, sight in changed.items():
+            if sight is None:
+                by_id.pop(sight_id, None)
+            else:
+                by_id[sight_id] = sight
+        CATALOG_UPDATES.inc()
+        snapshot = CatalogSnapshot(
+            sorted(by_id.values(), key=itemgetter('id')), version, self.render, previous=old, changed=changed
+        )
+        logger.info(f"Updated catalog with {len(changed)} changed sights in {time.perf_counter() - start:.2f}s")
+        return snapshot
+
+    def _restore(self, version):
+        start = time.perf_counter()
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                header = pickle.load(f)
+                if header[:2] != (SNAPSHOT_FORMAT, self.snapshot_key):
+                    logger.info("Catalog snapshot is out of date, rebuilding")
+                    return None
+                # Versions of a recreated storage count up from the start again
+                identity, saved_version = header[2:]
+                if identity != self.storage.identity():
+                    logger.info("Catalog snapshot is of another storage, rebuilding")
+                    return None
+                # Written before other processes changed some sights: worth it if only those can be read
+                if saved_version != version and self.storage.changes(saved_version) is None:
+                    logger.info("Catalog snapshot is out of date, rebuilding")
+                    return None
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read catalog snapshot, rebuilding: {str(e)}")
+            return None
+        self._saved_version = saved_version
+        logger.info(f"Restored catalog of {len(snapshot)} sights in {time.perf_counter() - start:.2f}s")
+        return snapshot
+
+    def save_snapshot(self):
+        # Writes the current snapshot unless the file already holds it; returns True if written
+        snapshot = self.get()
+        if not self.snapshot_file or snapshot.version == self._saved_version:
+            return False
+        with replace_atomic(self.snapshot_file) as f:
+            # Small header first, so a stale file is rejected without unpickling the rest
+            header = (SNAPSHOT_FORMAT, self.snapshot_key, self.storage.identity(), snapshot.version)
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+        self._saved_version = snapshot.version
+        logger.info(f"Saved catalog snapshot of {len(snapshot)} sights to {self.snapshot_file}")
+        return True
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import Dispatcher
+
+from metrics import UPDATES_SHED
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    # Updates of one chat (or one user, for inline queries) must stay in order
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return 'chat', chat.id
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return 'user', user.id
+    return None
+
+
+class _Task:
+    __slots__ = ('run', 'shed', 'coalesce', 'created', 'superseded')
+
+    def __init__(self, run, shed, coalesce):
+        self.run = run
+        self.shed = shed
+        self.coalesce = coalesce
+        self.created = time.monotonic()
+        self.superseded = False
+
+
+class ChatSerialExecutor:
+    # Runs tasks on a shared pool, but never two tasks of the same key at once or out of order.
+    # Tasks given a shed function can be skipped cheaply: when a newer task with the same coalesce
+    # key is queued behind them, when more than max_pending tasks are waiting already, or when
+    # they waited longer than max_age while at least `pressure` tasks were waiting
+    def __init__(self, workers, max_pending=None, max_age=None, pressure=0):
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.pressure = pressure
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat')
+        self._shed_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='shed')
+        self._lock = threading.Lock()
+        self._queues = {}  # key -> deque of pending tasks, present while a drain is scheduled
+        self._pending = 0
+        self._unkeyed = 0
+
+    def submit(self, key, run, shed=None, coalesce=None):
+        if key is None:
+            with self._lock:
+                self._unkeyed += 1
+            self._pool.submit(self._run_unkeyed, run)
+            return
+
+        task = _Task(run, shed, coalesce)
+        with self._lock:
+            if shed is not None and self.max_pending is not None and self._pending >= self.max_pending:
+                self._shed_pool.submit(self._shed, task, 'overload')
+                return
+            pending = self._queues.get(key)
+            if pending is not None:
+                if coalesce is not None:
+                    for older in pending:
+                        if older.coalesce == coalesce:
+                            older.superseded = True
+                pending.append(task)
+                self._pending += 1
+                return
+            self._queues[key] = deque([task])
+            self._pending += 1
+        self._pool.submit(self._drain, key)
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                pending = self._queues[key]
+                if not pending:
+                    del self._queues[key]
+                    return
+                task = pending.popleft()
+                # A slow handler of this chat alone is no reason to skip its later updates
+                stale = (task.shed is not None and self.max_age is not None and self._pending >= self.pressure
+                         and time.monotonic() - task.created > self.max_age)
+                self._pending -= 1
+            if task.superseded:
+                self._shed(task, 'superseded')
+            elif stale:
+                self._shed(task, 'stale')
+            else:
+                self._run(task.run)
+
+    def _run_unkeyed(self, task):
+        self._run(task)
+        with self._lock:
+            self._unkeyed -= 1
+
+    @staticmethod
+    def _run(task):
+        try:
+            task()
+        except Exception:
+            logger.exception("Unhandled error in chat worker")
+
+    @staticmethod
+    def _shed(task, reason):
+        UPDATES_SHED.inc(reason)
+        try:
+            task.shed()
+        except Exception as e:
+            logger.debug(f"Shedding an update failed: {str(e)}")
+
+    def queued(self):
+        with self._lock:
+            return self._pending
+
+    def idle(self):
+        with self._lock:
+            return not self._queues and not self._unkeyed
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+        self._shed_pool.shutdown(wait=True)
+
+
+class RecentKeys:
+    # Remembers keys for a few seconds, seen() tells whether a key already came up in that time
+    def __init__(self, window, size=10000):
+        self.window = window
+        self.size = size
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # key -> monotonic time, oldest first
+
+    def seen(self, key):
+        now = time.monotonic()
+        with self._lock:
+            at = self._seen.get(key)
+            if at is not None and now - at < self.window:
+                return True
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while self._seen and (len(self._seen) > self.size or now - next(iter(self._seen.values())) >= self.window):
+                self._seen.popitem(last=False)
+            return False
+
+
+class LatestOnly:
+    # Runs one action per key at a time; actions submitted meanwhile collapse into the newest,
+    # so a burst of taps on the same message renders the first and the last target only
+    def __init__(self, workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='latest')
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> newest waiting action (or None), present while one runs
+
+    def submit(self, key, action):
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = action
+                return
+            self._pending[key] = None
+        self._pool.submit(self._run, key, action)
+
+    def _run(self, key, action):
+        while True:
+            try:
+                action()
+            except Exception:
+                logger.exception("Unhandled error in debounced action")
+            with self._lock:
+                action = self._pending[key]
+                if action is None:
+                    del self._pending[key]
+                    return
+                self._pending[key] = None
+
+
+class ChatOrderedDispatcher(Dispatcher):
+    # Handles updates of different chats in parallel while keeping each chat's updates in order.
+    # coalesce(query) gives callback queries that replace each other while waiting the same key,
+    # or None. Only those may be skipped, and are then only answered so the button stops spinning;
+    # every other update, like a confirmation or a language choice, always runs
+    def __init__(self, *args, chat_workers=8, coalesce=None, max_pending=None, max_age=None, pressure=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.coalesce = coalesce
+        self.chat_executor = ChatSerialExecutor(chat_workers, max_pending, max_age, pressure)
+
+    def process_update(self, update):
+        process = super().process_update
+        query = getattr(update, 'callback_query', None)
+        coalesce = self.coalesce(query) if query is not None and self.coalesce else None
+        if coalesce is None:
+            self.chat_executor.submit(chat_key(update), lambda: process(update))
+            return
+        self.chat_executor.submit(chat_key(update), lambda: process(update), shed=query.answer, coalesce=coalesce)
+
+    def stop(self):
+        super().stop()
+        self.chat_executor.shutdown()
@@ -0,0 +1,156 @@
+import heapq
+import logging
+import math
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+POINTS_PER_CELL = 4  # The grid is sized so an average occupied area cell holds about this many sights
+CACHE_DEGREES = 0.05  # Locations this close share cached results
+CACHE_SIZE = 10000
+
+
+def parse_coords(url):
+    # Yandex Maps links carry the point as ll=<lon>,<lat>; returns [lat, lon] or None
+    try:
+        lon, lat = (float(part) for part in parse_qs(urlparse(url).query)['ll'][0].split(','))
+    except (KeyError, ValueError, AttributeError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return [lat, lon]
+
+
+def sight_coords(sight):
+    return sight.get('coords') or parse_coords(sight.get('location', ''))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def backfill_coords(storage):
+    # One-off: give sights saved before coordinates were parsed their coords field
+    filled = 0
+    for sight in storage.iter_sights():
+        if 'coords' not in sight:
+            coords = parse_coords(sight.get('location', ''))
+            if coords and storage.update(dict(sight, coords=coords)):
+                filled += 1
+    if filled:
+        logger.info(f"Filled in coordinates of {filled} sights")
+    return filled
+
+
+class GeoIndex:
+    # Fixed grid of lat/lon cells; nearest sights are found by searching rings of cells outwards
+    def __init__(self, sights, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self._coords = {}
+        for sight in sights:
+            coords = sight_coords(sight)
+            if coords:
+                self._coords[sight['id']] = coords
+
+        # Cells about as wide as they are tall around the sights' mean latitude, so a ring of
+        # cells is close to a circle and the search can stop early
+        lats = [lat for lat, _ in self._coords.values()] or [0.0]
+        lons = [lon for _, lon in self._coords.values()] or [0.0]
+        squeeze = max(math.cos(math.radians(sum(lats) / len(lats))), 0.1)
+        area = (max(lats) - min(lats)) * (max(lons) - min(lons)) * squeeze
+        self.cell_lat = min(max(math.sqrt(area * POINTS_PER_CELL / len(lats)), 0.01), 5.0)
+        self.cell_lon = self.cell_lat / squeeze
+
+        self._cells = {}
+        for sight_id, (lat, lon) in self._coords.items():
+            phi = math.radians(lat)
+            point = (phi, math.radians(lon), math.cos(phi), sight_id)
+            self._cells.setdefault(self._cell_of(lat, lon), []).append(point)
+        if self._cells:
+            rows, cols = zip(*self._cells)
+            self._bounds = min(rows), max(rows), min(cols), max(cols)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._coords)
+
+    def __getstate__(self):
+        # Pickled into catalog snapshots without the lock and the query cache
+        state = self.__dict__.copy()
+        del state['_cache'], state['_cache_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _cell_of(self, lat, lon):
+        return math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon)
+
+    def _ring(self, row, col, r):
+        # Occupied-area cells exactly r steps (Chebyshev) from (row, col)
+        row_min, row_max, col_min, col_max = self._bounds
+        for y in range(max(row - r, row_min), min(row + r, row_max) + 1):
+            if abs(y - row) == r:
+                xs = range(max(col - r, col_min), min(col + r, col_max) + 1)
+            else:
+                xs = [x for x in (col - r, col + r) if col_min <= x <= col_max]
+            for x in xs:
+                points = self._cells.get((y, x))
+                if points:
+                    yield points
+
+    def nearest(self, lat, lon, k=5):
+        # [(distance_km, sight_id)] closest first. Nearby users share the cached neighbours,
+        # only the distances are worked out again for the exact location
+        if not self._cells:
+            return []
+        key = (round(lat / CACHE_DEGREES), round(lon / CACHE_DEGREES), k)
+        with self._cache_lock:
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+        if ids is None:
+            ids = [sight_id for _, sight_id in self._search(lat, lon, k)]
+            with self._cache_lock:
+                self._cache[key] = ids
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return sorted((distance_km(lat, lon, *self._coords[sight_id]), sight_id) for sight_id in ids)
+
+    def _search(self, lat, lon, k):
+        row, col = self._cell_of(lat, lon)
+        row_min, row_max, col_min, col_max = self._bounds
+        # Skip the empty rings between a far away user and the sights
+        r = max(row_min - row, row - row_max, col_min - col, col - col_max, 0)
+        r_max = max(row - row_min, row_max - row, col - col_min, col_max - col)
+        phi, lam = math.radians(lat), math.radians(lon)
+        cos_phi = math.cos(phi)
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        best = []  # max-heap of (-haversine term, id), the term grows with the distance
+        while r <= r_max:
+            for points in self._ring(row, col, r):
+                for p_phi, p_lam, p_cos, sight_id in points:
+                    a = sin((p_phi - phi) / 2) ** 2 + cos_phi * p_cos * sin((p_lam - lam) / 2) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-a, sight_id))
+                    elif -a > best[0][0]:
+                        heapq.heapreplace(best, (-a, sight_id))
+            # Anything outside this ring is at least r cells away along some axis
+            if len(best) == k and 2 * EARTH_RADIUS_KM * asin(sqrt(min(1.0, -best[0][0]))) <= self._ring_distance(lat, r):
+                break
+            r += 1
+        return sorted((2 * EARTH_RADIUS_KM * asin(sqrt(min(1.0, -a))), sight_id) for a, sight_id in best)
+
+    def _ring_distance(self, lat, r):
+        # Lower bound for points beyond ring r: r cells north/south, or past the meridian r cells east/west
+        to_meridian = math.asin(math.cos(math.radians(lat)) * math.sin(math.radians(min(r * self.cell_lon, 90.0))))
+        return min(r * self.cell_lat * KM_PER_DEGREE, to_meridian * EARTH_RADIUS_KM)
@@ -0,0 +1,81 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Telegram shows photos at up to 1280px on the long side, anything bigger is wasted upload
+MAX_SIDE = 1280
+JPEG_QUALITY = 85
+MAX_PHOTO_BYTES = 20 * 1024 * 1024
+
+
+def _pillow():
+    # Pillow is optional and only needed by /add, so it is imported on first use
+    try:
+        from PIL import Image, ImageOps
+        return Image, ImageOps
+    except ImportError:
+        return None
+
+
+def _encode(data, max_side):
+    modules = _pillow()
+    if modules is None:
+        return None
+    Image, ImageOps = modules
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _touch(path):
+    # Marks an existing file as just used, so the janitor does not take it from an /add in progress
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def ingest_photo(download, images_dir):
+    # download(path) saves the original there; returns the stored photo's filename
+    fd, tmp_path = tempfile.mkstemp(dir=images_dir, suffix='.part')
+    os.close(fd)
+    try:
+        download(tmp_path)
+        if os.path.getsize(tmp_path) > MAX_PHOTO_BYTES:
+            raise ValueError(f"Photo is larger than {MAX_PHOTO_BYTES} bytes")
+        with open(tmp_path, 'rb') as f:
+            original = f.read()
+    finally:
+        os.remove(tmp_path)
+
+    # Named after the content, so the same picture is stored once and names never collide
+    digest = hashlib.sha256(original).hexdigest()[:20]
+    filename = f"{digest}.jpg"
+    photo_path = os.path.join(images_dir, filename)
+
+    if not _touch(photo_path):
+        photo = _encode(original, MAX_SIDE)
+        if photo is None:
+            logger.warning("Pillow is not installed, storing the photo as uploaded")
+            photo = original
+        write_atomic(photo_path, photo)
+    return filename
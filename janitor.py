@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Janitor:
+    # Background cleanup: drops deleted sights from storage and files nothing refers to from
+    # images/. Works in small batches and waits while updates are queued, so handlers never
+    # wait on it
+    def __init__(self, storage, images_dir, busy=None, interval=600, batch_size=100,
+                 pause=0.05, max_delay=30, grace=86400, on_removed=None):
+        self.storage = storage
+        self.images_dir = images_dir
+        self.busy = busy  # busy() is true while the bot has work waiting
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_delay = max_delay  # Longest a batch waits for the bot to go idle
+        self.grace = grace  # Unreferenced files younger than this may belong to an /add in progress
+        self.on_removed = on_removed
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Cleanup error: {str(e)}")
+
+    def _yield(self):
+        # Short pause after every batch, longer while the bot is busy
+        deadline = time.monotonic() + self.max_delay
+        self._stop.wait(self.pause)
+        while self.busy is not None and self.busy() and time.monotonic() < deadline:
+            if self._stop.wait(self.pause):
+                return
+
+    def run_once(self):
+        purged = 0
+        while not self._stop.is_set():
+            count = self.storage.purge(self.batch_size)
+            purged += count
+            if count < self.batch_size:
+                break
+            self._yield()
+
+        removed = self.collect_images() if not self._stop.is_set() else 0
+        if purged or removed:
+            logger.info(f"Cleanup: purged {purged} deleted sights, removed {removed} unused images")
+        return purged, removed
+
+    def collect_images(self):
+        # Read from storage rather than the catalog: a stale snapshot must never cost a live sight
+        # its photo. Nothing referenced more likely means a misconfigured storage than no photos
+        referenced = set()
+        for idx, sight in enumerate(self.storage.iter_sights(), 1):
+            if sight.get('photo'):
+                referenced.add(sight['photo'])
+            if idx % (self.batch_size * 10) == 0:
+                self._yield()  # Reading is cheaper than removing, so it pauses less often
+            if self._stop.is_set():
+                return 0
+        if not referenced:
+            return 0
+
+        cutoff = time.time() - self.grace
+        removed = 0
+        with os.scandir(self.images_dir) as entries:
+            for idx, entry in enumerate(entries, 1):
+                if self._stop.is_set():
+                    break
+                if idx % self.batch_size == 0:
+                    self._yield()
+                if entry.name in referenced or not entry.is_file():
+                    continue
+                try:
+                    if entry.stat().st_mtime > cutoff:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue  # Another process got there first
+                removed += 1
+                if self.on_removed is not None:
+                    self.on_removed(entry.name)
+        return removed
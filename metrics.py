@@ -0,0 +1,266 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *label_values):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[idx] += 1
+            series[-1] += value
+
+    def items(self):
+        with self._lock:
+            return sorted((key, list(series)) for key, series in self._series.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    # Value read from a callback at scrape time
+    def __init__(self, name, help_text, read=None):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def set(self, value):
+        self.read = lambda: value
+
+    def render(self):
+        if self.read is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _process_started():
+    # When the interpreter was started, not when this module was imported; Linux only
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+REGISTRY = Registry()
+STARTED = _process_started()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'bot_handler_seconds', "Time spent in each update handler", ['handler']))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', "Errors raised or logged while a handler ran", ['handler']))
+CATALOG_LOADS = REGISTRY.register(Counter(
+    'bot_catalog_loads_total', "Catalog snapshots loaded from storage"))
+CATALOG_UPDATES = REGISTRY.register(Counter(
+    'bot_catalog_updates_total', "Catalog snapshots patched with only the changed sights"))
+PHOTO_SENDS = REGISTRY.register(Counter(
+    'bot_photo_sends_total', "Sight photos sent, by uploaded file or cached file_id", ['source']))
+TRANSLATOR_CALLS = REGISTRY.register(Counter(
+    'bot_translator_calls_total', "Calls to the translation backend", ['result']))
+TRANSLATION_MEMORY = REGISTRY.register(Counter(
+    'bot_translation_memory_total', "Translations looked up in the translation memory", ['result']))
+STORAGE_WRITES = REGISTRY.register(Counter(
+    'bot_storage_writes_total', "Committed storage writes", ['op']))
+BROADCAST_SENDS = REGISTRY.register(Counter(
+    'bot_broadcast_sends_total', "Daily sight messages sent or failed", ['result']))
+UPDATES_SHED = REGISTRY.register(Counter(
+    'bot_updates_shed_total', "Button taps only answered: superseded by a newer tap, too old or overload", ['reason']))
+OUTBOX_SENDS = REGISTRY.register(Counter(
+    'bot_outbox_sends_total', "Outgoing messages sent, edits dropped for a newer one, and flood control retries", ['result']))
+OUTBOX_WAITING = REGISTRY.register(Gauge(
+    'bot_outbox_waiting', "Outgoing messages waiting for a send slot"))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'bot_dispatcher_queue_depth', "Updates waiting for the dispatcher or a chat worker"))
+READY_SECONDS = REGISTRY.register(Gauge(
+    'bot_ready_seconds', "Seconds from process start until updates were being fetched"))
+FIRST_RESPONSE_SECONDS = REGISTRY.register(Gauge(
+    'bot_first_response_seconds', "Seconds from process start until the first handler finished"))
+
+_current = threading.local()
+
+
+class ErrorLogCounter(logging.Handler):
+    # Handlers catch most errors themselves and only log them; count those too
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        handler = getattr(_current, 'handler', None)
+        if handler is not None:
+            HANDLER_ERRORS.inc(handler)
+
+
+def instrument(name, callback):
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        _current.handler = name
+        start = time.perf_counter()
+        try:
+            return callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+            _current.handler = None
+            if FIRST_RESPONSE_SECONDS.read is None:
+                _mark(FIRST_RESPONSE_SECONDS, "First response")
+    return wrapper
+
+
+def _mark(gauge, what):
+    seconds = time.time() - STARTED
+    gauge.set(round(seconds, 3))
+    logger.info(f"{what} {seconds:.2f}s after process start")
+
+
+def mark_ready():
+    _mark(READY_SECONDS, "Ready")
+
+
+def instrument_handlers(handlers):
+    # Wraps the callback of every handler, including the ones inside conversations
+    for handler in handlers:
+        nested = getattr(handler, 'entry_points', None)
+        if nested is not None:
+            instrument_handlers(nested)
+            for state_handlers in handler.states.values():
+                instrument_handlers(state_handlers)
+            instrument_handlers(handler.fallbacks)
+        elif not hasattr(handler.callback, '__wrapped__'):
+            handler.callback = instrument(handler.callback.__name__, handler.callback)
+
+
+def summary():
+    # Short human readable digest for /dev
+    lines = [f"⏱️ Uptime: {int(time.time() - STARTED) // 60} min"]
+    if READY_SECONDS.read is not None:
+        first = FIRST_RESPONSE_SECONDS.read() if FIRST_RESPONSE_SECONDS.read else '-'
+        lines.append(f"🚀 Ready after {READY_SECONDS.read()}s, first response after {first}s")
+    for (handler,), series in HANDLER_SECONDS.items():
+        count = sum(series[:-1])
+        errors = HANDLER_ERRORS.value(handler)
+        lines.append(f"• {handler}: {count} calls, avg {series[-1] / count * 1000:.0f} ms, {errors} errors")
+    lines.append(
+        f"📸 Photos: {PHOTO_SENDS.value('cached')} cached, {PHOTO_SENDS.value('upload')} uploaded"
+    )
+    translator_calls = sum(value for _, value in TRANSLATOR_CALLS.items())
+    lines.append(f"🌐 Translator: {translator_calls} calls, {TRANSLATOR_CALLS.value('error')} failed, "
+                 f"memory {TRANSLATION_MEMORY.value('hit')} hits, {TRANSLATION_MEMORY.value('miss')} misses")
+    lines.append(f"💾 Storage writes: {sum(value for _, value in STORAGE_WRITES.items())}, "
+                 f"catalog loads: {CATALOG_LOADS.value()} full, {CATALOG_UPDATES.value()} delta")
+    if QUEUE_DEPTH.read is not None:
+        lines.append(f"📥 Queue depth: {QUEUE_DEPTH.read()}")
+    if OUTBOX_WAITING.read is not None:
+        lines.append(
+            f"📤 Outbox: {OUTBOX_WAITING.read()} waiting, {OUTBOX_SENDS.value('sent')} sent, "
+            f"{OUTBOX_SENDS.value('dropped')} stale edits dropped, {OUTBOX_SENDS.value('retried')} retries"
+        )
+    shed = UPDATES_SHED.items()
+    if shed:
+        lines.append("🧹 Taps only answered: " + ", ".join(f"{value} {reason}" for (reason,), value in shed))
+    return '\n'.join(lines)
+
+
+def start_metrics_server(port, listen='127.0.0.1'):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    httpd = ThreadingHTTPServer((listen, port), Handler)
+    threading.Thread(target=httpd.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Metrics served on http://{listen}:{httpd.server_address[1]}/metrics")
+    return httpd
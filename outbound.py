@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+from telegram import CallbackQuery, Message
+from telegram.error import RetryAfter
+
+from metrics import OUTBOX_SENDS
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    # Token bucket kept as a "theoretical arrival time" (GCRA), so slots can be reserved ahead
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.tat = 0.0
+
+    def earliest(self, now):
+        return max(now, self.tat - self.tolerance)
+
+    def take(self, at):
+        self.tat = max(self.tat, at) + self.interval
+
+
+def target_of(method, kwargs):
+    # (chat_id, message_id or None) a bound PTB send/edit method will act on
+    owner = getattr(method, '__self__', None)
+    if isinstance(owner, CallbackQuery):
+        owner = owner.message
+    chat_id = kwargs.get('chat_id', owner.chat_id if isinstance(owner, Message) else None)
+    message_id = kwargs.get('message_id', owner.message_id if isinstance(owner, Message) else None)
+    return chat_id, message_id
+
+
+class Outbox:
+    # Every outgoing message goes through here so Telegram's flood limits are never hit
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, max_retries=5, chat_limit_size=100000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chat_limit_size = chat_limit_size
+        self._lock = threading.Lock()
+        self._global = RateLimit(global_rate, global_rate)
+        self._chats = {}
+        self._edit_seq = {}
+        self.waiting = 0
+
+    def _reserve(self, chat_id):
+        # Claims the next free slot for this chat and returns when it starts
+        with self._lock:
+            now = time.monotonic()
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                if len(self._chats) >= self.chat_limit_size:
+                    # Buckets of idle chats are full anyway, dropping them loses nothing
+                    self._chats = {k: v for k, v in self._chats.items() if v.tat > now}
+                chat = self._chats[chat_id] = RateLimit(self.chat_rate, self.chat_burst)
+            at = max(self._global.earliest(now), chat.earliest(now))
+            self._global.take(at)
+            chat.take(at)
+            return at
+
+    def _pause(self, seconds):
+        # Telegram asked us to back off; hold every chat, not just this one
+        with self._lock:
+            self._global.tat = max(self._global.tat, time.monotonic() + seconds + self._global.tolerance)
+
+    def send(self, method, *args, **kwargs):
+        chat_id, message_id = target_of(method, kwargs)
+        edit_key = None
+        if getattr(method, '__name__', '').startswith('edit_message') and message_id is not None:
+            # Only the newest pending edit of a message is worth sending
+            edit_key = (chat_id, message_id)
+            with self._lock:
+                seq = self._edit_seq[edit_key] = self._edit_seq.get(edit_key, 0) + 1
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                delay = self._reserve(chat_id) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                if edit_key is not None and self._edit_seq.get(edit_key) != seq:
+                    OUTBOX_SENDS.inc('dropped')
+                    return None
+                try:
+                    result = method(*args, **kwargs)
+                    OUTBOX_SENDS.inc('sent')
+                    return result
+                except RetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    # Each further retry waits a little longer than Telegram asked
+                    logger.warning(f"Flood control, retrying in {e.retry_after}s")
+                    OUTBOX_SENDS.inc('retried')
+                    self._pause(e.retry_after * (1 + attempt / 2))
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if edit_key is not None and self._edit_seq.get(edit_key) == seq:
+                    del self._edit_seq[edit_key]
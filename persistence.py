@@ -0,0 +1,212 @@
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+
+from telegram.ext import BasePersistence
+
+logger = logging.getLogger(__name__)
+
+# The only user_data keys that outlive a restart; wizard state and the like stay in memory
+PERSISTED_KEYS = ('lang', 'current_page')
+
+
+class LazyUserData(defaultdict):
+    # user_data of the users seen lately, loaded from the database on first access. Once
+    # over capacity, the least recently used users without unsaved or in-memory-only state
+    # are dropped; they are loaded again when they come back
+    def __init__(self, load, is_clean, capacity):
+        super().__init__(dict)
+        self._load = load
+        self._is_clean = is_clean
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def __missing__(self, user_id):
+        # Read outside the lock so other users are not held up by the database
+        data = self._load(user_id)
+        with self._lock:
+            existing = dict.get(self, user_id)
+            if existing is not None:
+                return existing
+            dict.__setitem__(self, user_id, data)
+            if len(self) > self.capacity:
+                self._evict(len(self) - self.capacity)
+            return data
+
+    def __getitem__(self, user_id):
+        # Moving the user to the end keeps the dict in least recently used order
+        with self._lock:
+            data = dict.pop(self, user_id, None)
+            if data is not None:
+                dict.__setitem__(self, user_id, data)
+                return data
+        return self.__missing__(user_id)
+
+    def _evict(self, count):
+        victims = []
+        for user_id, data in dict.items(self):
+            if len(victims) == count:
+                break
+            if self._is_clean(user_id, data):
+                victims.append(user_id)
+        for user_id in victims:
+            dict.__delitem__(self, user_id)
+
+
+class UserStatePersistence(BasePersistence):
+    # Keeps each user's language and list position in one small SQLite row. Changes are
+    # collected in memory and written in one transaction per flush(), users are read on demand.
+    # Only the values that changed are written, so processes sharing the file do not undo each
+    # other's changes to the other value. A user is read again before their next update once
+    # another connection has written to the file
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            lang TEXT,
+            current_page INTEGER
+        );
+    """
+
+    def __init__(self, path, capacity=100000):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._stored = {}  # user id -> persisted values as last read or written
+        self._dirty = {}  # user id -> {key: value} of changes waiting for the next flush
+        self._epoch = 0  # Bumped whenever another connection is seen to have written
+        self._read_at = {}  # user id -> epoch the user was last read in
+        self.user_data = LazyUserData(self._load, self._is_clean, capacity)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, user_id):
+        return self._conn().execute(
+            "SELECT lang, current_page FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone() or (None,) * len(PERSISTED_KEYS)
+
+    def _current_epoch(self):
+        # data_version moves when any other connection, in this process or another, commits
+        conn = self._conn()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            if version != getattr(self._local, 'data_version', None):
+                self._local.data_version = version
+                self._epoch += 1
+            return self._epoch
+
+    def _load(self, user_id):
+        epoch = self._current_epoch()
+        row = self._read(user_id)
+        with self._lock:
+            self._stored[user_id] = row
+            self._read_at[user_id] = epoch
+        return {key: value for key, value in zip(PERSISTED_KEYS, row) if value is not None}
+
+    def _is_clean(self, user_id, data):
+        # Safe to forget: nothing waiting to be written and nothing that exists only in memory
+        with self._lock:
+            if user_id in self._dirty or not set(data) <= set(PERSISTED_KEYS):
+                return False
+            self._stored.pop(user_id, None)
+            self._read_at.pop(user_id, None)
+            return True
+
+    # user_data holds no Bot objects, so PTB's deep copy on every update is skipped
+    def insert_bot(self, obj):
+        return obj
+
+    @classmethod
+    def replace_bot(cls, obj):
+        return obj
+
+    def get_user_data(self):
+        return self.user_data
+
+    def refresh_user_data(self, user_id, user_data):
+        # Called before every handler; picks up what another process wrote for this user since
+        # they were last read. Changes of ours that are not written yet win
+        epoch = self._current_epoch()
+        with self._lock:
+            if self._read_at.get(user_id) == epoch:
+                return
+        row = self._read(user_id)
+        with self._lock:
+            self._read_at[user_id] = epoch
+            pending = self._dirty.get(user_id, {})
+            stored = list(self._stored.get(user_id, (None,) * len(PERSISTED_KEYS)))
+            for idx, key in enumerate(PERSISTED_KEYS):
+                if key in pending:
+                    continue
+                stored[idx] = row[idx]
+                if row[idx] is None:
+                    user_data.pop(key, None)
+                else:
+                    user_data[key] = row[idx]
+            self._stored[user_id] = tuple(stored)
+
+    def update_user_data(self, user_id, data):
+        # Called after every update of the user; only a changed language or page is queued
+        values = tuple(data.get(key) for key in PERSISTED_KEYS)
+        with self._lock:
+            stored = self._stored.get(user_id, (None,) * len(PERSISTED_KEYS))
+            if stored != values:
+                self._stored[user_id] = values
+                changes = self._dirty.setdefault(user_id, {})
+                for key, old, new in zip(PERSISTED_KEYS, stored, values):
+                    if old != new:
+                        changes[key] = new
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in PERSISTED_KEYS:
+                rows = [(user_id, changes[key]) for user_id, changes in dirty.items() if key in changes]
+                if rows:
+                    conn.executemany(
+                        f"INSERT INTO users (user_id, {key}) VALUES (?, ?) "
+                        f"ON CONFLICT (user_id) DO UPDATE SET {key} = excluded.{key}", rows
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            with self._lock:
+                # Keep them for the next flush, unless the user changed again meanwhile
+                for user_id, changes in dirty.items():
+                    pending = self._dirty.setdefault(user_id, {})
+                    for key, value in changes.items():
+                        pending.setdefault(key, value)
+            raise
+        logger.debug(f"Saved state of {len(dirty)} users")
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        return {}
+
+    def update_conversation(self, name, key, new_state):
+        pass
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
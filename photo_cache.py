@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+class PhotoCache:
+    # Maps "<photo filename>:<content hash>" to the file_id Telegram gave us for it
+    def __init__(self, path, images_dir):
+        self.path = path
+        self.images_dir = images_dir
+        self._lock = threading.Lock()
+        self._digests = {}  # filename -> (mtime_ns, size, sha256)
+        try:
+            with open(self.path, 'r') as f:
+                self._file_ids = json.load(f)
+        except (OSError, ValueError):
+            self._file_ids = {}
+
+    def _key(self, filename):
+        stat = os.stat(os.path.join(self.images_dir, filename))
+        cached = self._digests.get(filename)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return f"{filename}:{cached[2]}"
+
+        # Only hash when the file is new to us or has changed on disk
+        digest = hashlib.sha256()
+        with open(os.path.join(self.images_dir, filename), 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        self._digests[filename] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return f"{filename}:{digest.hexdigest()}"
+
+    def get(self, filename):
+        return self._file_ids.get(self._key(filename))
+
+    def put(self, filename, file_id):
+        key = self._key(filename)
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._save()
+
+    def invalidate(self, filename):
+        prefix = f"{filename}:"
+        with self._lock:
+            self._digests.pop(filename, None)
+            stale = [key for key in self._file_ids if key.startswith(prefix)]
+            for key in stale:
+                del self._file_ids[key]
+            if stale:
+                self._save()
+
+    def _save(self):
+        # Write to a temp file of our own first, so a crash or another process saving at the
+        # same time never leaves a truncated cache
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._file_ids, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,109 @@
+import logging
+from collections import namedtuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.utils.helpers import escape_markdown
+
+logger = logging.getLogger(__name__)
+
+# Everything needed to show one sight in one language
+SightCard = namedtuple('SightCard', ['caption', 'keyboard', 'details_keyboard'])
+
+
+def render_caption(sight, lang):
+    return (
+        f"✨ *{escape_markdown(sight['name'][lang], version=2)}*\n\n"
+        f"📖 {escape_markdown(sight['description'][lang], version=2)}\n\n"
+        f"🎩 {escape_markdown(sight['fun_fact'][lang], version=2)}"
+    )
+
+
+class RenderCache:
+    # Captions and keyboard layouts for one catalog snapshot, built once when it loads. Only plain
+    # strings are kept, so the cache pickles quickly into catalog snapshots; the telegram markup
+    # objects are cheap to build per request
+    def __init__(self, sights, translations, per_page, previous=None, changed=()):
+        # previous: the cache of an older snapshot, whose captions are reused for sights not in changed
+        self.per_page = per_page
+        self.page_count = max(1, -(-len(sights) // per_page))
+        self._labels = {
+            lang: (texts['show_location'], texts['back_list'], texts['prev_button'], texts['next_button'])
+            for lang, texts in translations.items()
+        }
+        self._cards = {}
+        self._pages = {}
+        self._order = [sight['id'] for sight in sights]
+        kept_pages = self._unchanged_pages(previous, changed) if previous is not None else 0
+
+        for lang, texts in translations.items():
+            rendered = []
+            for sight in sights:
+                cached = None
+                if previous is not None and sight['id'] not in changed:
+                    cached = previous._cards.get((sight['id'], lang))
+                if cached is not None:
+                    rendered.append((sight['id'], cached[0], cached[1]))
+                    continue
+                try:
+                    rendered.append((sight['id'], render_caption(sight, lang), sight['location']))
+                except KeyError as e:
+                    logger.warning(f"Sight {sight['id']} has no {e} for {lang}, not rendered")
+
+            # Previous and next sight of the details carousel, wrapping around at the ends
+            for idx, (sight_id, caption, url) in enumerate(rendered):
+                prev_id = rendered[idx - 1][0]
+                next_id = rendered[(idx + 1) % len(rendered)][0]
+                self._cards[sight_id, lang] = (caption, url, prev_id, next_id)
+
+            for page in range(kept_pages):
+                self._pages[page, lang] = previous._pages[page, lang]
+            for page in range(kept_pages, self.page_count):
+                self._pages[page, lang] = self._render_page(sights, page, lang, texts)
+
+    def _unchanged_pages(self, previous, changed):
+        # Full pages in front of the first changed or moved sight; the last page is always
+        # rendered again since its next button depends on what follows
+        same = 0
+        for sight_id, old_id in zip(self._order, previous._order):
+            if sight_id != old_id or sight_id in changed:
+                break
+            same += 1
+        return min(same // self.per_page, self.page_count - 1, previous.page_count - 1)
+
+    def _render_page(self, sights, page, lang, texts):
+        # (title, rows of (label, callback_data) buttons)
+        start = page * self.per_page
+        end = start + self.per_page
+
+        keyboard = []
+        for idx, sight in enumerate(sights[start:end], start + 1):
+            keyboard.append(((f"{idx}. {sight['name'][lang]}", f"details_{sight['id']}"),))
+
+        # Add navigation buttons
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append((texts['prev_button'], f"page_{page - 1}"))
+        if end < len(sights):
+            nav_buttons.append((texts['next_button'], f"page_{page + 1}"))
+        if nav_buttons:
+            keyboard.append(tuple(nav_buttons))
+
+        return texts['list_title'].format(page=page + 1), tuple(keyboard)
+
+    def card(self, sight_id, lang):
+        # Raises KeyError for sights that could not be rendered
+        caption, url, prev_id, next_id = self._cards[sight_id, lang]
+        show_location, back_list, prev_button, next_button = self._labels[lang]
+        location = InlineKeyboardButton(show_location, url=url)
+        back = InlineKeyboardButton(back_list, callback_data='back_to_list')
+        carousel = [
+            InlineKeyboardButton(prev_button, callback_data=f"carousel_{prev_id}"),
+            InlineKeyboardButton(next_button, callback_data=f"carousel_{next_id}")
+        ]
+        return SightCard(caption, InlineKeyboardMarkup([[location]]), InlineKeyboardMarkup([carousel, [location, back]]))
+
+    def page(self, page, lang):
+        # (text, reply_markup); pages past the end show the last one
+        title, rows = self._pages[min(max(page, 0), self.page_count - 1), lang]
+        keyboard = [[InlineKeyboardButton(label, callback_data=data) for label, data in row] for row in rows]
+        return title, InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,141 @@
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+# Cyrillic is folded to Latin so "karel" finds "Карелы" and the other way round
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+# Field weights; a token keeps the highest weight of the fields it appears in
+NAME_WEIGHT = 3
+FIELD_WEIGHTS = {'name': NAME_WEIGHT, 'description': 1, 'fun_fact': 1}
+WEIGHT_BITS = max(FIELD_WEIGHTS.values()).bit_length()  # A sight's words pack the weight below the position
+
+# Shorter query tokens only match whole words, prefixes of them would match nearly everything
+MIN_PREFIX = 2
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.translate(TRANSLIT)
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', normalize(text))
+
+
+class SearchIndex:
+    # Sorted token list with postings, prefix lookups are a bisect plus a short scan. Postings are
+    # kept by field weight in id order, so the best matches come first and a search stops once
+    # nothing left can beat its results; each sight's own words check it against the other
+    # query tokens
+    def __init__(self, sights):
+        postings = {}
+        for sight in sights:
+            for field, weight in FIELD_WEIGHTS.items():
+                for text in sight.get(field, {}).values():
+                    for token in tokenize(text):
+                        entry = postings.setdefault(token, {})
+                        if entry.get(sight['id'], 0) < weight:
+                            entry[sight['id']] = weight
+
+        self._tokens = sorted(postings)
+        self._tiers = []  # [(weight, ids)] per token, highest weight first
+        self._words = {}  # sight id -> array of token position << WEIGHT_BITS | weight
+        for pos, token in enumerate(self._tokens):
+            ids = {}
+            for sight_id, weight in postings[token].items():
+                ids.setdefault(weight, array('I')).append(sight_id)
+                words = self._words.get(sight_id)
+                if words is None:
+                    words = self._words[sight_id] = array('I')
+                words.append(pos << WEIGHT_BITS | weight)
+            self._tiers.append(sorted(ids.items(), reverse=True))
+        self._sights = {sight['id']: sight for sight in sights}
+
+    def _match(self, query_token):
+        # Range of token positions the query token matches, and the position of the whole word
+        idx = bisect_left(self._tokens, query_token)
+        exact = idx if idx < len(self._tokens) and self._tokens[idx] == query_token else None
+        if len(query_token) < MIN_PREFIX:
+            return idx, idx if exact is None else idx + 1, exact
+        return idx, bisect_left(self._tokens, query_token + '\uffff', idx), exact
+
+    def _candidates(self, match, names_only):
+        # (score, sight id) for one query token, best score first and ids ascending within a score
+        start, end, exact = match
+        streams = {}
+        for pos in range(start, end):
+            # Whole-word hits rank above prefix hits
+            bonus = 2 if pos == exact else 1
+            for weight, ids in self._tiers[pos]:
+                if names_only and weight < NAME_WEIGHT:
+                    break
+                streams.setdefault(weight * bonus, []).append(ids)
+        seen = set()
+        for score in sorted(streams, reverse=True):
+            for sight_id in heapq.merge(*streams[score]):
+                if sight_id not in seen:
+                    seen.add(sight_id)
+                    yield score, sight_id
+
+    def _size(self, match):
+        start, end, _ = match
+        return sum(len(ids) for pos in range(start, end) for _, ids in self._tiers[pos])
+
+    def _best(self, match, names_only):
+        # Highest score the query token can give any sight; tiers start with the highest weight
+        start, end, exact = match
+        weights = ((self._tiers[pos][0][0], pos) for pos in range(start, end))
+        return max((weight * (2 if pos == exact else 1) for weight, pos in weights
+                    if not names_only or weight >= NAME_WEIGHT), default=0)
+
+    def _score(self, match, sight_id, names_only):
+        start, end, exact = match
+        mask = (1 << WEIGHT_BITS) - 1
+        best = 0
+        for word in self._words[sight_id]:
+            pos, weight = word >> WEIGHT_BITS, word & mask
+            if start <= pos < end and (not names_only or weight >= NAME_WEIGHT):
+                best = max(best, weight * (2 if pos == exact else 1))
+        return best
+
+    def search(self, query, limit=10, names_only=False):
+        query_tokens = set(tokenize(query))
+        if not query_tokens or limit <= 0:
+            return []
+
+        # Every query token has to match. Candidates come from the rarest one, the others only
+        # add to their score
+        matches = sorted((self._match(token) for token in query_tokens), key=self._size)
+        driver, others = matches[0], matches[1:]
+        others_best = [self._best(match, names_only) for match in others]
+        if not all(others_best):
+            return []
+        bound = sum(others_best)
+
+        best = []  # min-heap of (score, -id): the worst of the current results on top
+        for score, sight_id in self._candidates(driver, names_only):
+            if len(best) == limit and best[0] >= (score + bound, -sight_id):
+                break  # Later candidates score lower, or as high with a higher id
+            total = score
+            for match in others:
+                extra = self._score(match, sight_id, names_only)
+                if not extra:
+                    break
+                total += extra
+            else:
+                if len(best) < limit:
+                    heapq.heappush(best, (total, -sight_id))
+                elif (total, -sight_id) > best[0]:
+                    heapq.heapreplace(best, (total, -sight_id))
+
+        return [self._sights[-neg_id] for _, neg_id in sorted(best, reverse=True)]
@@ -0,0 +1,130 @@
+import random
+import threading
+from array import array
+from collections import OrderedDict
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x):
+    # splitmix64 finalizer
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _permute(i, n, key):
+    # Position of i in a pseudo-random order of range(n) picked by key: a small Feistel network
+    # over the next power of four, walking the cycle until it lands inside range(n)
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    while True:
+        left, right = i >> half, i & mask
+        for r in range(4):
+            left, right = right, left ^ (_mix(key ^ (right << 2) ^ r) & mask)
+        i = (left << half) | right
+        if i < n:
+            return i
+
+
+class _Round:
+    __slots__ = ('key', 'epoch', 'base', 'size', 'cursor', 'held', 'last')
+
+    def __init__(self, key):
+        self.key = key
+        self.epoch = None  # Starts a round on the first draw
+        self.base = 0  # The round walks order[base:size] in a keyed order
+        self.size = 0
+        self.cursor = 0  # Entries of it drawn so far
+        self.held = None  # Index in the order put off to avoid an immediate repeat
+        self.last = None
+
+
+class ShuffleBags:
+    # Per-user random order without repeats: every sight comes up once before any comes up again.
+    # All users share one list of sight ids; a user only keeps a key and a position in their own
+    # permutation of it, so memory per user does not grow with the catalog
+    def __init__(self, weight=None, capacity=200000, rng=None):
+        self.weight = weight or (lambda sight: 1)
+        self.capacity = capacity
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._rounds = OrderedDict()  # user id -> _Round, least recently used first
+        self._version = None
+        self._ids = set()
+        self._order = array('I')  # Sight ids, repeated by weight, in the order they were added
+        self._epoch = 0  # Bumped when the order is rebuilt; rounds of an older epoch start over
+
+    def _weighted(self, sights):
+        ids = array('I')
+        for sight in sights:
+            ids.extend([sight['id']] * max(1, int(self.weight(sight))))
+        return ids
+
+    def _sync(self, catalog):
+        # New sights are appended, so rounds in progress pick them up at their end; deleted ones
+        # stay in the order and are skipped when drawn, until they make up half of it
+        if catalog.version == self._version:
+            return
+        ids = set(catalog.by_id)
+        self._order.extend(self._weighted(catalog.by_id[i] for i in sorted(ids - self._ids)))
+        self._ids = ids
+        self._version = catalog.version
+        live = sum(max(1, int(self.weight(sight))) for sight in catalog.sights)
+        if len(self._order) > 2 * live:
+            self._order = self._weighted(catalog.sights)
+            self._epoch += 1
+
+    def _round(self, user_id):
+        state = self._rounds.get(user_id)
+        if state is None:
+            if len(self._rounds) >= self.capacity:
+                # Forgetting an idle user's round only costs them a fresh shuffle
+                self._rounds.popitem(last=False)
+            state = self._rounds[user_id] = _Round(self.rng.getrandbits(64))
+        else:
+            self._rounds.move_to_end(user_id)
+        return state
+
+    def _advance(self, state):
+        # Sights added during the round finish it, in an order of their own; then a new round
+        state.key = _mix(state.key)
+        if state.epoch == self._epoch and state.size < len(self._order):
+            state.base = state.size
+        else:
+            state.base = 0
+        state.epoch = self._epoch
+        state.size = len(self._order)
+        state.cursor = 0
+        state.held = None
+
+    def _take(self, state):
+        idx = state.base + _permute(state.cursor, state.size - state.base, state.key)
+        state.cursor += 1
+        return idx
+
+    def _next(self, state):
+        if state.held is not None and state.epoch == self._epoch:
+            idx, state.held = state.held, None
+            return self._order[idx]
+        if state.epoch != self._epoch or state.cursor >= state.size - state.base:
+            self._advance(state)
+        idx = self._take(state)
+        if self._order[idx] == state.last and state.cursor < state.size - state.base:
+            # Same sight as last time: show the next one first and this one right after
+            state.held = idx
+            idx = self._take(state)
+        return self._order[idx]
+
+    def draw(self, user_id, catalog):
+        if not catalog.sights:
+            return None
+        with self._lock:
+            self._sync(catalog)
+            state = self._round(user_id)
+            while True:
+                sight = catalog.by_id.get(self._next(state))
+                if sight is not None:
+                    state.last = sight['id']
+                    return sight
@@ -0,0 +1,682 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+
+from metrics import STORAGE_WRITES
+
+logger = logging.getLogger(__name__)
+
+
+class SightStorage:
+    # Interface every storage backend implements
+    writes = 0  # Writes made through this object, other processes' writes only show in version()
+
+    def _committed(self, op):
+        self.writes += 1
+        STORAGE_WRITES.inc(op)
+
+    def load(self):
+        # Returns (version, sights) read from one consistent state
+        raise NotImplementedError
+
+    def version(self):
+        raise NotImplementedError
+
+    def identity(self):
+        # Tells this store apart from a new one in the same place, whose versions start over
+        return None
+
+    def changes(self, since):
+        # (version, {sight id: sight, or None if deleted}) for the writes after version `since`,
+        # or None when the backend cannot tell and everything has to be loaded again
+        return None
+
+    def get(self, sight_id):
+        raise NotImplementedError
+
+    def insert(self, sight):
+        # Assigns a fresh id, stores the sight and returns it with the id set
+        raise NotImplementedError
+
+    def update(self, sight):
+        # Replaces the stored sight with the same id, returns False if it is gone
+        raise NotImplementedError
+
+    def delete(self, sight_id):
+        # Returns True if a sight was removed; readers stop seeing it at once, though backends
+        # may only leave a tombstone until purge()
+        raise NotImplementedError
+
+    def purge(self, limit=100):
+        # Frees the space of deleted sights, at most about `limit` of them per call; returns how
+        # many were dropped. For the background janitor, never called from handlers
+        return 0
+
+    def insert_many(self, sights):
+        # Like insert for a whole batch; backends override it to write once per batch
+        return [self.insert(sight) for sight in sights]
+
+    def iter_sights(self):
+        # Every stored sight in id order
+        return iter(self.load()[1])
+
+    def import_json(self, path):
+        with open(path, 'r') as f:
+            sights = json.load(f)['sights']
+        for sight in sights:
+            self.insert(sight)
+        return len(sights)
+
+    def export_json(self, path):
+        _, sights = self.load()
+        write_json_atomic(path, {'sights': list(sights)})
+        return len(sights)
+
+
+@contextmanager
+def replace_atomic(path, mode='wb'):
+    # Yields a temp file of our own next to path and renames it over path once written, so
+    # readers never see a half-written file and processes saving at the same time never mix
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path, data):
+    with replace_atomic(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+class SQLiteStorage(SightStorage):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sights (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0  -- Tombstone until purge() drops the row
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', random());
+
+        -- Which sights each version changed, so other processes reload only those
+        CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER NOT NULL,
+            sight_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS changes_version ON changes (version);
+        INSERT OR IGNORE INTO meta (key, value)
+            SELECT 'changes_from', value FROM meta WHERE key = 'version';
+        CREATE TRIGGER IF NOT EXISTS sights_insert_logged AFTER INSERT ON sights BEGIN
+            INSERT INTO changes SELECT value + 1, NEW.id FROM meta WHERE key = 'version';
+        END;
+        CREATE TRIGGER IF NOT EXISTS sights_update_logged AFTER UPDATE ON sights BEGIN
+            INSERT INTO changes SELECT value + 1, NEW.id FROM meta WHERE key = 'version';
+        END;
+        DROP TRIGGER IF EXISTS sights_delete_logged;
+        CREATE TRIGGER sights_delete_logged AFTER DELETE ON sights WHEN NOT OLD.deleted BEGIN
+            INSERT INTO changes SELECT value + 1, OLD.id FROM meta WHERE key = 'version';
+        END;
+    """
+    CHANGELOG_VERSIONS = 1000  # Versions kept in the changelog; readers further behind reload everything
+
+    def __init__(self, path, seed_json=None):
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._conn()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sights)")]
+        if columns and 'deleted' not in columns:
+            conn.execute("ALTER TABLE sights ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+        conn.executescript(self.SCHEMA)
+
+        # First run: pull in the existing JSON catalog
+        empty = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM sights)").fetchone()[0]
+        if empty and seed_json and os.path.exists(seed_json):
+            count = self.import_json(seed_json)
+            logger.info(f"Imported {count} sights from {seed_json}")
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between dispatcher threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, op, statements):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(conn)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            oldest = conn.execute(
+                "SELECT value - ? FROM meta WHERE key = 'version'", (self.CHANGELOG_VERSIONS,)
+            ).fetchone()[0]
+            if oldest > 0:
+                conn.execute("DELETE FROM changes WHERE version <= ?", (oldest,))
+                conn.execute("UPDATE meta SET value = max(value, ?) WHERE key = 'changes_from'", (oldest,))
+            conn.execute("COMMIT")
+            self._committed(op)
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row_to_sight(row):
+        sight = json.loads(row[1])
+        sight['id'] = row[0]
+        return sight
+
+    def version(self):
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def identity(self):
+        # Random number picked when the database was created
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def load(self):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            rows = conn.execute("SELECT id, data FROM sights WHERE NOT deleted ORDER BY id").fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return version, [self._row_to_sight(row) for row in rows]
+
+    def changes(self, since):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            if not isinstance(since, int) or not meta['changes_from'] <= since <= meta['version']:
+                return None
+            ids = [row[0] for row in conn.execute("SELECT DISTINCT sight_id FROM changes WHERE version > ?", (since,))]
+            rows = conn.execute(
+                "SELECT id, data FROM sights WHERE id IN (SELECT sight_id FROM changes WHERE version > ?) AND NOT deleted",
+                (since,)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        changed = dict.fromkeys(ids)
+        changed.update((row[0], self._row_to_sight(row)) for row in rows)
+        return meta['version'], changed
+
+    def iter_sights(self, batch_size=500):
+        # Pages by id, so exporting never holds the whole table in memory
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, data FROM sights WHERE id > ? AND NOT deleted ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_sight(row)
+            last_id = rows[-1][0]
+
+    def get(self, sight_id):
+        row = self._conn().execute("SELECT id, data FROM sights WHERE id = ? AND NOT deleted", (sight_id,)).fetchone()
+        return self._row_to_sight(row) if row else None
+
+    def insert(self, sight):
+        data = json.dumps({k: v for k, v in sight.items() if k != 'id'}, ensure_ascii=False)
+
+        def statements(conn):
+            return conn.execute("INSERT INTO sights (data) VALUES (?)", (data,)).lastrowid
+
+        return dict(sight, id=self._write('insert', statements))
+
+    def insert_many(self, sights):
+        rows = [json.dumps({k: v for k, v in sight.items() if k != 'id'}, ensure_ascii=False) for sight in sights]
+
+        def statements(conn):
+            return [conn.execute("INSERT INTO sights (data) VALUES (?)", (data,)).lastrowid for data in rows]
+
+        return [dict(sight, id=sight_id) for sight, sight_id in zip(sights, self._write('insert', statements))]
+
+    def update(self, sight):
+        data = json.dumps({k: v for k, v in sight.items() if k != 'id'}, ensure_ascii=False)
+
+        def statements(conn):
+            return conn.execute(
+                "UPDATE sights SET data = ? WHERE id = ? AND NOT deleted", (data, sight['id'])
+            ).rowcount > 0
+
+        return self._write('update', statements)
+
+    def delete(self, sight_id):
+        # Only marks the row; purge() removes it later
+        def statements(conn):
+            return conn.execute("UPDATE sights SET deleted = 1 WHERE id = ? AND NOT deleted", (sight_id,)).rowcount > 0
+
+        return self._write('delete', statements)
+
+    def purge(self, limit=100):
+        # Readers never see tombstones, so dropping them needs no new version
+        conn = self._conn()
+        return conn.execute(
+            "DELETE FROM sights WHERE id IN (SELECT id FROM sights WHERE deleted LIMIT ?)", (limit,)
+        ).rowcount
+
+    def import_json(self, path):
+        with open(path, 'r') as f:
+            sights = json.load(f)['sights']
+
+        def statements(conn):
+            for sight in sights:
+                data = json.dumps({k: v for k, v in sight.items() if k != 'id'}, ensure_ascii=False)
+                taken = sight.get('id') is None or conn.execute(
+                    "SELECT 1 FROM sights WHERE id = ?", (sight['id'],)
+                ).fetchone()
+                if taken:
+                    # Older files could hand out the same id twice, give the copy a new one
+                    conn.execute("INSERT INTO sights (data) VALUES (?)", (data,))
+                else:
+                    conn.execute("INSERT INTO sights (id, data) VALUES (?, ?)", (sight['id'], data))
+
+        self._write('import', statements)
+        return len(sights)
+
+
+class JsonStorage(SightStorage):
+    # The original sights.json format; every write rewrites the whole file
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def version(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        with self._lock:
+            return self.version(), self._read()['sights']
+
+    def get(self, sight_id):
+        return next((s for s in self.load()[1] if s['id'] == sight_id), None)
+
+    def insert(self, sight):
+        with self._lock:
+            data = self._read()
+            max_id = max((s['id'] for s in data['sights']), default=0)
+            next_id = max(data.get('next_id', 0), max_id + 1)
+            sight = dict(sight, id=next_id)
+            data['sights'].append(sight)
+            data['next_id'] = next_id + 1
+            write_json_atomic(self.path, data)
+            self._committed('insert')
+            return sight
+
+    def insert_many(self, sights):
+        with self._lock:
+            data = self._read()
+            max_id = max((s['id'] for s in data['sights']), default=0)
+            next_id = max(data.get('next_id', 0), max_id + 1)
+            sights = [dict(sight, id=next_id + offset) for offset, sight in enumerate(sights)]
+            data['sights'].extend(sights)
+            data['next_id'] = next_id + len(sights)
+            write_json_atomic(self.path, data)
+            self._committed('insert')
+            return sights
+
+    def update(self, sight):
+        with self._lock:
+            data = self._read()
+            for idx, stored in enumerate(data['sights']):
+                if stored['id'] == sight['id']:
+                    data['sights'][idx] = sight
+                    write_json_atomic(self.path, data)
+                    self._committed('update')
+                    return True
+            return False
+
+    def delete(self, sight_id):
+        with self._lock:
+            data = self._read()
+            sights = [s for s in data['sights'] if s['id'] != sight_id]
+            if len(sights) == len(data['sights']):
+                return False
+            data['sights'] = sights
+            write_json_atomic(self.path, data)
+            self._committed('delete')
+            return True
+
+
+class RecordStorage(SightStorage):
+    # Append-only file with one JSON line per write; an id -> offset index reads a sight without the others.
+    # Updates and deletes append a new line (deletes a tombstone), compaction drops the dead ones
+    INDEX_HEADER = struct.Struct('<8sQQQQ')  # magic, data file inode, bytes covered, entries, next id
+    INDEX_MAGIC = b'SIGHTIDX'
+    INDEX_SAVE_EVERY = 1000  # Appended records before the index file is rewritten
+    COMPACT_MIN_BYTES = 1024 * 1024
+    COMPACT_RATIO = 0.5  # Share of dead bytes that triggers a compaction
+
+    def __init__(self, path, seed_json=None):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self._lock = threading.RLock()
+        self._ino = None
+        self._map = None
+        self._reset()
+
+        open(path, 'ab').close()
+        with self._lock:
+            self._refresh()
+
+        # A new file starts with a random generation, so it is not mistaken for an older one
+        # that had the same inode
+        def build():
+            if self._end:
+                return [], False
+            return [{'next_id': self._next_id, 'generation': random.getrandbits(63)}], True
+
+        # First run: pull in the existing JSON catalog
+        if self._write('create', build) and seed_json and os.path.exists(seed_json):
+            count = self.import_json(seed_json)
+            logger.info(f"Imported {count} sights from {seed_json}")
+
+    def _reset(self):
+        self._offsets = array('Q')  # Indexed by sight id
+        self._lengths = array('I')  # 0 when the id is unused or deleted
+        self._next_id = 1
+        self._end = 0  # Bytes of the data file the index covers
+        self._live = 0  # Bytes taken by the current version of each sight
+        self._unsaved = 0
+
+    def _load_index(self, ino):
+        # Start from the saved index if it belongs to this data file, else rebuild from scratch
+        self._reset()
+        self._ino = ino
+        self._map = None
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, index_ino, end, count, next_id = self.INDEX_HEADER.unpack(f.read(self.INDEX_HEADER.size))
+                if magic != self.INDEX_MAGIC or index_ino != ino or end > os.path.getsize(self.path):
+                    raise ValueError("Index does not match the data file")
+                self._offsets.fromfile(f, count)
+                self._lengths.fromfile(f, count)
+        except (OSError, EOFError, ValueError, struct.error) as e:
+            logger.info(f"Rebuilding sight index: {str(e)}")
+            self._reset()
+            return
+        self._end = end
+        self._next_id = next_id
+        self._live = sum(self._lengths) + count - self._lengths.count(0)
+
+    def _save_index(self):
+        header = self.INDEX_HEADER.pack(
+            self.INDEX_MAGIC, self._ino, self._end, len(self._offsets), self._next_id
+        )
+        # Also saved from read paths without the file lock, so each save has a temp file of its own
+        with replace_atomic(self.index_path) as f:
+            f.write(header)
+            self._offsets.tofile(f)
+            self._lengths.tofile(f)
+        self._unsaved = 0
+
+    def _refresh(self):
+        # Pick up a compaction or appends made by another process
+        stat = os.stat(self.path)
+        if stat.st_ino != self._ino:
+            self._load_index(stat.st_ino)
+        if stat.st_size > self._end:
+            self._scan()
+        return stat
+
+    def _scan(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self._end)
+            offset = self._end
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Half-written line of an interrupted append
+                self._apply(json.loads(line), offset, len(line) - 1)
+                offset += len(line)
+                self._unsaved += 1
+        self._end = offset
+        if self._unsaved >= self.INDEX_SAVE_EVERY:
+            self._save_index()
+
+    def _apply(self, record, offset, length):
+        if 'next_id' in record:
+            self._next_id = max(self._next_id, record['next_id'])
+            return
+        sight_id = record.get('tombstone', record.get('id'))
+        self._next_id = max(self._next_id, sight_id + 1)
+        missing = sight_id + 1 - len(self._offsets)
+        if missing > 0:
+            self._offsets.frombytes(bytes(8 * missing))
+            self._lengths.frombytes(bytes(4 * missing))
+        if self._lengths[sight_id]:
+            self._live -= self._lengths[sight_id] + 1
+        if 'tombstone' in record:
+            self._lengths[sight_id] = 0
+        else:
+            self._offsets[sight_id] = offset
+            self._lengths[sight_id] = length
+            self._live += length + 1
+
+    def _exists(self, sight_id):
+        return 0 <= sight_id < len(self._lengths) and self._lengths[sight_id] > 0
+
+    def _read(self, sight_id):
+        return json.loads(self._map_range(self._offsets[sight_id], self._lengths[sight_id]))
+
+    def _locked_file(self):
+        # Opens the data file for appending with an exclusive lock, even if another process
+        # compacted (replaced) it while we waited
+        while True:
+            f = open(self.path, 'ab')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return f
+            f.close()
+
+    def _write(self, op, build):
+        # build() runs under the lock on an up to date index and returns (records, result)
+        with self._lock, self._locked_file() as f:
+            self._refresh()
+            f.truncate(self._end)
+            records, result = build()
+            if not records:
+                return result
+
+            lines = [json.dumps(record, ensure_ascii=False).encode() + b'\n' for record in records]
+            f.write(b''.join(lines))
+            f.flush()
+            for record, line in zip(records, lines):
+                self._apply(record, self._end, len(line) - 1)
+                self._end += len(line)
+            self._unsaved += len(records)
+            self._committed(op)
+            if self._unsaved >= self.INDEX_SAVE_EVERY:
+                self._save_index()
+            return result
+
+    def _compact(self):
+        # Rewrites only the current version of each sight; the next id and generation survive in a header line
+        generation = self._generation() or random.getrandbits(63)
+        header = json.dumps({'next_id': self._next_id, 'generation': generation}).encode() + b'\n'
+        offsets = array('Q', bytes(8 * len(self._offsets)))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as out:
+            out.write(header)
+            position = len(header)
+            for sight_id, length in enumerate(self._lengths):
+                if length:
+                    start = self._offsets[sight_id]
+                    out.write(self._map_range(start, length + 1))
+                    offsets[sight_id] = position
+                    position += length + 1
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.path)
+        logger.info(f"Compacted {self.path} from {self._end} to {position} bytes")
+
+        self._offsets = offsets
+        self._end = position
+        self._live = position - len(header)
+        self._ino = os.stat(self.path).st_ino
+        self._map = None
+        self._save_index()
+
+    def _map_range(self, start, length):
+        if self._map is None or len(self._map) < start + length:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[start:start + length]
+
+    def purge(self, limit=100):
+        # Dead lines go in one compaction once they take enough of the file; limit does not apply
+        with self._lock, self._locked_file():
+            self._refresh()
+            if self._end < self.COMPACT_MIN_BYTES or self._end - self._live <= self._end * self.COMPACT_RATIO:
+                return 0
+            # Every line that is not the current version of a sight: old versions, tombstones, header
+            dead = self._map_range(0, self._end).count(b'\n') - (len(self._lengths) - self._lengths.count(0))
+            self._compact()
+            return dead
+
+    def version(self):
+        # Appends grow the file, compaction replaces it
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_size
+
+    def _generation(self):
+        # Random number in the header line a new file starts with; None for older files
+        with open(self.path, 'rb') as f:
+            first = f.readline()
+        try:
+            return json.loads(first).get('generation')
+        except ValueError:
+            return None
+
+    def identity(self):
+        # Files from before the generation header can only be told apart by their inode
+        with self._lock:
+            generation = self._generation()
+            return generation if generation is not None else self._refresh().st_ino
+
+    def load(self):
+        with self._lock:
+            stat = self._refresh()
+            sights = [self._read(sight_id) for sight_id, length in enumerate(self._lengths) if length]
+            return (stat.st_ino, stat.st_size), sights
+
+    def changes(self, since):
+        # The lines appended after `since` are the changelog; a compaction in between replaced the file
+        with self._lock:
+            stat = self._refresh()
+            if not isinstance(since, tuple) or since[0] != stat.st_ino or since[1] > self._end:
+                return None
+            ids = set()
+            if since[1] < self._end:
+                try:
+                    for line in self._map_range(since[1], self._end - since[1]).splitlines():
+                        record = json.loads(line)
+                        if 'next_id' not in record:
+                            ids.add(record.get('tombstone', record.get('id')))
+                except ValueError:
+                    return None  # `since` ended inside a half-written line that was later cut off
+            changed = {sight_id: self._read(sight_id) if self._exists(sight_id) else None for sight_id in ids}
+            return (stat.st_ino, stat.st_size), changed
+
+    def iter_sights(self, batch_size=500):
+        start = 0
+        while True:
+            with self._lock:
+                self._refresh()
+                end = min(start + batch_size, len(self._lengths))
+                batch = [self._read(sight_id) for sight_id in range(start, end) if self._lengths[sight_id]]
+            if start >= end:
+                return
+            yield from batch
+            start = end
+
+    def get(self, sight_id):
+        with self._lock:
+            self._refresh()
+            return self._read(sight_id) if self._exists(sight_id) else None
+
+    def insert(self, sight):
+        return self.insert_many([sight])[0]
+
+    def insert_many(self, sights):
+        def build():
+            stored = [dict(sight, id=self._next_id + offset) for offset, sight in enumerate(sights)]
+            return stored, stored
+
+        return self._write('insert', build)
+
+    def update(self, sight):
+        def build():
+            if not self._exists(sight['id']):
+                return [], False
+            return [sight], True
+
+        return self._write('update', build)
+
+    def delete(self, sight_id):
+        def build():
+            if not self._exists(sight_id):
+                return [], False
+            return [{'tombstone': sight_id}], True
+
+        return self._write('delete', build)
+
+    def import_json(self, path):
+        with open(path, 'r') as f:
+            sights = json.load(f)['sights']
+
+        def build():
+            # Keep the ids from the file where they are free, like SQLiteStorage does
+            kept = set()
+            for sight in sights:
+                sight_id = sight.get('id')
+                if isinstance(sight_id, int) and sight_id > 0 and sight_id not in kept and not self._exists(sight_id):
+                    kept.add(sight_id)
+                else:
+                    sight['id'] = None
+            next_id = max([self._next_id] + [sight_id + 1 for sight_id in kept])
+            for sight in sights:
+                if sight['id'] is None:
+                    sight['id'] = next_id
+                    next_id += 1
+            return sights, len(sights)
+
+        return self._write('import', build)
+
+
+def open_storage(backend, sights_file, database_file, records_file=None):
+    if backend == 'sqlite':
+        return SQLiteStorage(database_file, seed_json=sights_file)
+    if backend == 'json':
+        return JsonStorage(sights_file)
+    if backend == 'records':
+        return RecordStorage(records_file, seed_json=sights_file)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from broadcast import Broadcaster, Subscribers
+
+
+def make_broadcaster(tmp_path, chats, fail=()):
+    subscribers = Subscribers(str(tmp_path / 'subscribers.db'))
+    for chat_id in chats:
+        subscribers.subscribe(chat_id, 'en')
+    sent = []
+
+    def send(chat_id, lang, sight_id):
+        if chat_id in fail:
+            raise RuntimeError("send failed")
+        sent.append(chat_id)
+
+    return subscribers, Broadcaster(subscribers, send, rate=1000, workers=2, page_size=2), sent
+
+
+CATALOG = SimpleNamespace(sights=({'id': 1},))
+
+
+def test_groups_with_negative_ids_are_sent_to(tmp_path):
+    chats = [-1001234567890, -100123, 42, 7]
+    subscribers, broadcaster, sent = make_broadcaster(tmp_path, chats)
+    state = broadcaster.run(CATALOG, '2026-01-01')
+    assert sorted(sent) == sorted(chats)
+    assert state['total'] == state['sent'] == 4
+    assert state['finished']
+
+
+def test_resume_skips_chats_already_handled(tmp_path):
+    chats = [-100123, -5, 3, 42]
+    subscribers, broadcaster, sent = make_broadcaster(tmp_path, chats)
+    subscribers.start_broadcast('2026-01-01', 1)
+    # A crash after the first chat was sent, before the page was finished
+    subscribers.delivered('2026-01-01', -100123, True)
+
+    state = broadcaster.run(CATALOG, '2026-01-01', resume_only=True)
+    assert sorted(sent) == [-5, 3, 42]
+    assert state['sent'] == 4
+
+
+def test_finished_broadcast_is_not_sent_again(tmp_path):
+    subscribers, broadcaster, sent = make_broadcaster(tmp_path, [-1, 1])
+    broadcaster.run(CATALOG, '2026-01-01')
+    broadcaster.run(CATALOG, '2026-01-01')
+    assert sorted(sent) == [-1, 1]
+
+
+def test_failed_sends_are_counted(tmp_path):
+    subscribers, broadcaster, sent = make_broadcaster(tmp_path, [-7, 1, 2], fail={1})
+    state = broadcaster.run(CATALOG, '2026-01-01')
+    assert (state['sent'], state['failed']) == (2, 1)
@@ -0,0 +1,56 @@
+import random
+from collections import Counter
+
+from catalog import CatalogSnapshot
+from shuffle import ShuffleBags
+
+
+def catalog(ids, version):
+    return CatalogSnapshot([{'id': i} for i in ids], version)
+
+
+def test_each_sight_once_per_round():
+    bags = ShuffleBags(rng=random.Random(1))
+    snapshot = catalog(range(1, 38), 1)
+    for _ in range(3):
+        drawn = [bags.draw(7, snapshot)['id'] for _ in range(37)]
+        assert sorted(drawn) == list(range(1, 38))
+
+
+def test_users_get_their_own_order():
+    bags = ShuffleBags(rng=random.Random(2))
+    snapshot = catalog(range(1, 51), 1)
+    first = [bags.draw(1, snapshot)['id'] for _ in range(50)]
+    second = [bags.draw(2, snapshot)['id'] for _ in range(50)]
+    assert sorted(first) == sorted(second) and first != second
+
+
+def test_no_immediate_repeat_across_rounds():
+    bags = ShuffleBags(rng=random.Random(3))
+    snapshot = catalog(range(1, 4), 1)
+    drawn = [bags.draw(7, snapshot)['id'] for _ in range(300)]
+    assert all(a != b for a, b in zip(drawn, drawn[1:]))
+
+
+def test_weighted_sights_come_up_by_weight_per_round():
+    bags = ShuffleBags(weight=lambda sight: 3 if sight['id'] == 1 else 1, rng=random.Random(4))
+    snapshot = catalog(range(1, 11), 1)
+    drawn = Counter(bags.draw(7, snapshot)['id'] for _ in range(12))
+    assert drawn == Counter({1: 3, **dict.fromkeys(range(2, 11), 1)})
+
+
+def test_sights_added_and_deleted_mid_round():
+    bags = ShuffleBags(rng=random.Random(5))
+    drawn = [bags.draw(7, catalog(range(1, 11), 1))['id'] for _ in range(4)]
+
+    # One sight not drawn yet is deleted and two are added before the round is over
+    deleted = min(set(range(1, 11)) - set(drawn))
+    live = [i for i in range(1, 13) if i != deleted]
+    snapshot = catalog(live, 2)
+    drawn += [bags.draw(7, snapshot)['id'] for _ in range(len(live) - 4)]
+    assert sorted(drawn) == live
+    assert sorted(bags.draw(7, snapshot)['id'] for _ in range(len(live))) == live
+
+
+def test_empty_catalog():
+    assert ShuffleBags().draw(7, catalog([], 1)) is None
@@ -0,0 +1,73 @@
+import pytest
+
+from storage import RecordStorage, SQLiteStorage
+
+
+def sight(name, **extra):
+    return dict({
+        'name': {'en': name, 'ru': name},
+        'description': {'en': 'A place', 'ru': 'Место'},
+        'fun_fact': {'en': 'Cold', 'ru': 'Холодно'},
+        'photo': f"{name}.jpg",
+        'location': 'https://yandex.ru/maps/?pt=33.08,68.97',
+    }, **extra)
+
+
+@pytest.fixture(params=['sqlite', 'records'])
+def storage(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteStorage(str(tmp_path / 'sights.db'))
+    return RecordStorage(str(tmp_path / 'sights.ndjson'))
+
+
+def test_round_trip(storage):
+    stored = storage.insert(sight('Murmansk'))
+    assert storage.get(stored['id']) == stored
+    assert storage.insert_many([sight('Teriberka'), sight('Kirovsk')])[1]['name']['en'] == 'Kirovsk'
+
+    stored['name'] = {'en': 'Murmansk port', 'ru': 'Мурманский порт'}
+    assert storage.update(stored)
+    _, sights = storage.load()
+    assert [s['name']['en'] for s in sights] == ['Murmansk port', 'Teriberka', 'Kirovsk']
+    assert list(storage.iter_sights()) == list(sights)
+
+
+def test_deleted_sight_is_gone_and_stays_gone_after_purge(storage):
+    first, second = storage.insert_many([sight('Murmansk'), sight('Teriberka')])
+    assert storage.delete(first['id'])
+    assert not storage.delete(first['id'])
+    assert storage.get(first['id']) is None
+    assert not storage.update(first)
+    storage.purge()
+    assert [s['id'] for s in storage.load()[1]] == [second['id']]
+
+
+def test_changes_list_updated_and_deleted_sights(storage):
+    first, second = storage.insert_many([sight('Murmansk'), sight('Teriberka')])
+    since = storage.version()
+    second['featured'] = True
+    storage.update(second)
+    storage.delete(first['id'])
+    third = storage.insert(sight('Kirovsk'))
+
+    version, changed = storage.changes(since)
+    assert version == storage.version() > since
+    assert changed == {first['id']: None, second['id']: second, third['id']: third}
+    assert storage.changes(version) == (version, {})
+
+
+def test_changes_are_seen_by_another_process(storage):
+    since = storage.version()
+    stored = storage.insert(sight('Murmansk'))
+    other = type(storage)(storage.path)
+    assert other.identity() == storage.identity()
+    assert other.get(stored['id']) == stored
+    assert other.changes(since)[1] == {stored['id']: stored}
+
+
+def test_new_store_in_the_same_place_has_another_identity(storage, tmp_path):
+    storage.insert(sight('Murmansk'))
+    identity = storage.identity()
+    for path in tmp_path.iterdir():
+        path.unlink()
+    assert type(storage)(storage.path).identity() != identity
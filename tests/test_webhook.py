@@ -0,0 +1,67 @@
+import http.client
+import json
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+from webhook import SECRET_HEADER, WebhookServer, run_webhook
+
+SECRET = 's3cret'
+UPDATE = {'update_id': 1, 'message': {
+    'message_id': 1, 'date': 0, 'chat': {'id': 42, 'type': 'private'}, 'text': '/start'}}
+
+
+@pytest.fixture
+def server():
+    dispatcher = SimpleNamespace(bot=None, update_queue=queue.Queue())
+    server = WebhookServer(dispatcher, '127.0.0.1', 0, '/hook', SECRET)
+    server.start()
+    yield server
+    server.shutdown(drain_timeout=0)
+
+
+def post(server, body, headers=None, path='/hook'):
+    headers = dict({SECRET_HEADER: SECRET, 'Content-Length': str(len(body))}, **(headers or {}))
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    try:
+        conn.putrequest('POST', path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.endheaders(body)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def test_update_is_queued(server):
+    assert post(server, json.dumps(UPDATE).encode()) == 200
+    assert server.dispatcher.update_queue.get_nowait().effective_chat.id == 42
+
+
+@pytest.mark.parametrize('secret', ['', 'wrong'])
+def test_wrong_secret_is_refused(server, secret):
+    assert post(server, json.dumps(UPDATE).encode(), {SECRET_HEADER: secret}) == 403
+    assert server.dispatcher.update_queue.empty()
+
+
+@pytest.mark.parametrize('body, headers', [
+    (b'not json', None),
+    (b'[1, 2]', None),
+    (b'{}', None),
+    (b'{"update_id": 1}', {'Content-Length': 'abc'}),
+    (b'{"update_id": 1}', {'Content-Length': '0'}),
+    (b'{"update_id": 1}', {'Content-Length': str(10 ** 9)}),
+])
+def test_bad_body_is_refused(server, body, headers):
+    assert post(server, body, headers) == 400
+    assert server.dispatcher.update_queue.empty()
+
+
+def test_unknown_path(server):
+    assert post(server, json.dumps(UPDATE).encode(), path='/other') == 404
+
+
+def test_public_url_needs_a_secret():
+    with pytest.raises(ValueError):
+        run_webhook(None, '127.0.0.1', 0, '/hook', url='https://example.com/hook')
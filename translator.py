@@ -0,0 +1,260 @@
+import heapq
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from metrics import TRANSLATION_MEMORY, TRANSLATOR_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class TranslatorBackend:
+    # Interface for the service that does the actual translating
+    def translate_batch(self, texts, source, target):
+        raise NotImplementedError
+
+
+class GoogleBackend(TranslatorBackend):
+    # Google only accepts ~5000 characters per request
+    MAX_BATCH_CHARS = 4500
+    SEPARATOR = '\n\n'
+
+    def __init__(self):
+        self._translators = {}
+
+    def _translator(self, source, target):
+        translator = self._translators.get((source, target))
+        if translator is None:
+            # Imported on first use, only admins in /add ever need it
+            from deep_translator import GoogleTranslator
+            translator = GoogleTranslator(source=source, target=target)
+            self._translators[(source, target)] = translator
+        return translator
+
+    def translate_batch(self, texts, source, target):
+        translator = self._translator(source, target)
+        if len(texts) > 1:
+            joined = self.SEPARATOR.join(texts)
+            # One request for all fields when they can be split back apart safely
+            if len(joined) <= self.MAX_BATCH_CHARS and not any('\n' in text for text in texts):
+                parts = (translator.translate(joined) or '').split(self.SEPARATOR)
+                if len(parts) == len(texts):
+                    return [part.strip() for part in parts]
+                logger.warning("Batched translation came back misaligned, translating one by one")
+        return [translator.translate(text) for text in texts]
+
+
+class StubBackend(TranslatorBackend):
+    # Offline backend for tests and local runs, no network involved
+    def __init__(self):
+        self.calls = 0
+
+    def translate_batch(self, texts, source, target):
+        self.calls += 1
+        return [f"[{target}] {text}" for text in texts]
+
+
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class TranslationMemory:
+    # LRU cache of finished translations, persisted in SQLite between restarts
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS translations (
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            text TEXT NOT NULL,
+            translation TEXT NOT NULL,
+            used INTEGER NOT NULL,
+            PRIMARY KEY (source, target, text)
+        )
+    """
+
+    def __init__(self, path, capacity=10000):
+        self.capacity = capacity
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entries = None
+        self._clock = 0
+
+    def _load(self):
+        # Opened on first use, most users of the bot never need a translation
+        if self._entries is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(self.SCHEMA)
+
+        # Oldest first, so the OrderedDict starts out in LRU order
+        rows = self._conn.execute(
+            "SELECT source, target, text, translation, used FROM translations "
+            "ORDER BY used DESC LIMIT ?", (self.capacity,)
+        ).fetchall()
+        self._entries = OrderedDict(((s, t, x), tr) for s, t, x, tr, _ in reversed(rows))
+        self._clock = rows[0][4] if rows else 0
+
+    def get(self, source, target, text):
+        key = (source, target, normalize_text(text))
+        with self._lock:
+            self._load()
+            translation = self._entries.get(key)
+            if translation is None:
+                TRANSLATION_MEMORY.inc('miss')
+                return None
+            TRANSLATION_MEMORY.inc('hit')
+            self._entries.move_to_end(key)
+            self._clock += 1
+            self._conn.execute(
+                "UPDATE translations SET used = ? WHERE source = ? AND target = ? AND text = ?",
+                (self._clock, *key)
+            )
+            return translation
+
+    def put(self, source, target, text, translation):
+        key = (source, target, normalize_text(text))
+        with self._lock:
+            self._load()
+            self._entries[key] = translation
+            self._entries.move_to_end(key)
+            self._clock += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (source, target, text, translation, used) "
+                "VALUES (?, ?, ?, ?, ?)", (*key, translation, self._clock)
+            )
+            while len(self._entries) > self.capacity:
+                evicted, _ = self._entries.popitem(last=False)
+                self._conn.execute(
+                    "DELETE FROM translations WHERE source = ? AND target = ? AND text = ?", evicted
+                )
+
+
+class Translator:
+    # Translation memory in front of a pluggable backend
+    def __init__(self, backend, memory=None):
+        self.backend = backend
+        self.memory = memory
+
+    def translate(self, text, source, target):
+        return self.translate_many([text], source, target)[0]
+
+    def translate_many(self, texts, source, target):
+        results = [None] * len(texts)
+        missing = []
+        for idx, text in enumerate(texts):
+            cached = self.memory.get(source, target, text) if self.memory else None
+            if cached is not None:
+                results[idx] = cached
+            else:
+                missing.append(idx)
+
+        if missing:
+            try:
+                translated = self.backend.translate_batch([texts[idx] for idx in missing], source, target)
+            except Exception:
+                TRANSLATOR_CALLS.inc('error')
+                raise
+            TRANSLATOR_CALLS.inc('ok')
+            for idx, translation in zip(missing, translated):
+                results[idx] = translation
+                if translation and self.memory:
+                    self.memory.put(source, target, texts[idx], translation)
+        return results
+
+
+class TranslationPipeline:
+    # Runs translations off the dispatcher threads and retries the ones that fail
+    def __init__(self, translator, workers=2, max_pending=32, retry_delay=30, max_attempts=6):
+        self.translator = translator
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._retries = []  # heap of (due, seq, job)
+        self._retry_seq = 0
+        self._retry_cond = threading.Condition()
+        self._retry_thread = None
+
+    def submit(self, texts, source, target):
+        # Future of a list of translations; fails at once when too much is queued
+        if not self._slots.acquire(blocking=False):
+            future = Future()
+            future.set_exception(RuntimeError("Translation queue is full"))
+            return future
+        future = self._executor.submit(self.translator.translate_many, texts, source, target)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def wait(future, timeout):
+        # The translations, or None if they failed or are not ready in time
+        try:
+            translations = future.result(timeout=None if timeout is None else max(timeout, 0))
+        except TimeoutError:
+            return None
+        except Exception as e:
+            logger.error(f"Translation error: {str(e)}")
+            return None
+        return translations if all(translations) else None
+
+    def fill_later(self, texts, source, target, callback, future=None):
+        # Calls callback(translations) once they exist, reusing a still running future if any
+        job = (texts, source, target, callback, 0)
+        if future is None or future.done():
+            self._schedule(job, 0)
+            return
+
+        def on_done(done):
+            translations = self.wait(done, 0)
+            if translations is None:
+                self._schedule(job, 0)
+            else:
+                self._deliver(job, translations)
+
+        future.add_done_callback(on_done)
+
+    def _schedule(self, job, delay):
+        with self._retry_cond:
+            self._retry_seq += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._retry_seq, job))
+            if self._retry_thread is None:
+                # Started with the first retry, most runs never need one
+                self._retry_thread = threading.Thread(target=self._retry_loop, name='translate-retry', daemon=True)
+                self._retry_thread.start()
+            self._retry_cond.notify()
+
+    def _deliver(self, job, translations):
+        try:
+            job[3](translations)
+        except Exception as e:
+            logger.error(f"Error storing late translation: {str(e)}")
+
+    def _retry_loop(self):
+        while True:
+            with self._retry_cond:
+                while not self._retries or self._retries[0][0] > time.monotonic():
+                    timeout = self._retries[0][0] - time.monotonic() if self._retries else None
+                    self._retry_cond.wait(timeout)
+                _, _, job = heapq.heappop(self._retries)
+
+            texts, source, target, callback, attempt = job
+            translations = self.wait(self._executor.submit(self.translator.translate_many, texts, source, target), None)
+            if translations is not None:
+                self._deliver(job, translations)
+            elif attempt + 1 < self.max_attempts:
+                # Back off exponentially so a struggling translator is not hammered
+                self._schedule((texts, source, target, callback, attempt + 1), self.retry_delay * 2 ** attempt)
+            else:
+                logger.error(f"Giving up on translating {len(texts)} texts to {target}")
+
+
+def open_translator(backend, memory_file, capacity):
+    backends = {'google': GoogleBackend, 'stub': StubBackend}
+    if backend not in backends:
+        raise ValueError(f"Unknown translator backend: {backend}")
+    return Translator(backends[backend](), TranslationMemory(memory_file, capacity))
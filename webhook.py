@@ -0,0 +1,121 @@
+import hmac
+import json
+import logging
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookServer:
+    # Minimal HTTP listener that feeds Telegram webhook calls into the dispatcher queue
+    def __init__(self, dispatcher, listen, port, path, secret=None):
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret = secret
+        self._httpd = ThreadingHTTPServer((listen, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Health check for the reverse proxy
+                self._reply(200 if self.path == server.path else 404)
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                if server.secret and not hmac.compare_digest(
+                        self.headers.get(SECRET_HEADER, ''), server.secret):
+                    self._reply(403)
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    if not 0 < length <= MAX_BODY_BYTES:
+                        raise ValueError(f"Content-Length {length} is out of range")
+                    data = json.loads(self.rfile.read(length))
+                    if not isinstance(data, dict):
+                        raise ValueError("Update is not a JSON object")
+                    update = Update.de_json(data, server.dispatcher.bot)
+                    if update is None:
+                        raise ValueError("Update is empty")
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    logger.warning(f"Rejected webhook body: {str(e)}")
+                    self._reply(400)
+                    return
+
+                # Answer right away, Telegram waits for us before sending the next update
+                server.dispatcher.update_queue.put(update)
+                self._reply(200)
+
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        logger.info(f"Webhook listening on {self._httpd.server_address} at {self.path}")
+
+    def shutdown(self, drain_timeout=30):
+        # Stop taking updates, then give the queued ones a chance to finish
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+        deadline = time.monotonic() + drain_timeout
+        executor = getattr(self.dispatcher, 'chat_executor', None)
+        while time.monotonic() < deadline:
+            if self.dispatcher.update_queue.empty() and (executor is None or executor.idle()):
+                break
+            time.sleep(0.1)
+        else:
+            logger.warning("Webhook drain timed out, stopping with updates still queued")
+
+
+def run_webhook(updater, listen, port, path, url=None, secret=None):
+    # Blocks until SIGINT/SIGTERM, then drains and stops
+    if url and not secret:
+        # Anyone reaching the proxy could post updates in an admin's name
+        raise ValueError("A public webhook URL needs a secret, set WEBHOOK_SECRET")
+    dispatcher = updater.dispatcher
+    server = WebhookServer(dispatcher, listen, port, path, secret)
+
+    updater.job_queue.start()
+    threading.Thread(target=dispatcher.start, name='dispatcher', daemon=True).start()
+    server.start()
+
+    # Without a public URL we only serve locally, e.g. for replaying recorded updates
+    if url:
+        dispatcher.bot.set_webhook(url=url, api_kwargs={'secret_token': secret} if secret else None)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    while not stop.wait(1):
+        pass
+
+    logger.info("Shutting down webhook")
+    server.shutdown()
+    dispatcher.stop()
+    updater.job_queue.stop()